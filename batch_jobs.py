@@ -0,0 +1,311 @@
+"""
+Headless batch jobs: orders, catalog changes and reports from a file
+"""
+
+import csv
+from datetime import date, datetime, timedelta
+import json
+import math
+import time
+
+from inventory_backend import OrderManager, Product
+
+class JobError(Exception):
+    """A job that cannot be applied; it goes to the reject file."""
+
+def write_csv(filename, header, rows):
+    """Write one report; runs in worker processes."""
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return filename
+
+class BatchRunner:
+    """Apply a JSON Lines file of jobs without any prompts.
+
+    One job per line::
+
+        {"op": "order", "items": [{"product_id": "P1", "quantity": 2}], "discount": 5}
+        {"op": "upsert", "product_id": "P1", "name": "Fan", "price": 999.0, "quantity": 10}
+        {"op": "delete", "product_id": "P1"}
+        {"op": "report", "report": "daily_sales", "date": "2025-09-30"}
+
+    Jobs are applied ``chunk_size`` at a time, each chunk in one storage
+    transaction and inventory batch with one ``record_sales`` call, so the
+    catalog and sales are persisted once per chunk rather than once per row.
+    A job that cannot be applied (bad JSON, unknown product, not enough
+    stock, invalid field) is written to ``rejects`` as
+    ``{"line": n, "error": ..., "job": ...}`` and the rest of its chunk goes
+    ahead. A report sees every job above it: the open chunk is committed
+    first.
+
+    ``bill_writer`` (a ``BillWriter`` or ``PooledBillWriter``) saves a bill
+    per order in ``bill_format``; ``executor`` writes report CSVs on a
+    process pool instead of inline.
+    """
+
+    reports = ('daily_sales', 'sales_range', 'low_stock', 'reorder', 'product_sales')
+
+    def __init__(self, inventory_manager, rejects, chunk_size=500, bill_writer=None,
+                 bill_format='txt', velocity=None, executor=None):
+        self.inventory = inventory_manager
+        self.storage = inventory_manager.storage
+        self.order_manager = OrderManager(inventory_manager)
+        self.rejects = rejects
+        self.chunk_size = chunk_size
+        self.bill_writer = bill_writer
+        self.bill_format = bill_format
+        self.velocity = velocity
+        self.executor = executor
+        self.exports = []
+        self.counts = dict.fromkeys(['order', 'upsert', 'delete', 'report', 'rejected'], 0)
+
+    def run(self, jobs_file):
+        """Apply every job in ``jobs_file``; returns the counts per op, plus
+        ``rejected``, ``rows`` and ``seconds``."""
+        started = time.perf_counter()
+        rows = 0
+        chunk = []
+        with open(jobs_file, mode='r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                rows += 1
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise JobError("job must be a JSON object")
+                except (ValueError, JobError) as e:
+                    self.reject(line_number, line.rstrip('\n'), str(e))
+                    continue
+                if job.get('op') == 'report':
+                    self.run_chunk(chunk)
+                    chunk = []
+                    self.run_report(line_number, job)
+                    continue
+                chunk.append((line_number, job))
+                if len(chunk) >= self.chunk_size:
+                    self.run_chunk(chunk)
+                    chunk = []
+        self.run_chunk(chunk)
+
+        if self.bill_writer is not None:
+            for filename, error in self.bill_writer.flush():
+                print(f"Could not save bill {filename}: {error}")
+        for filename, future in self.exports:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Could not save report {filename}: {e}")
+        counts = dict(self.counts, rows=rows, seconds=time.perf_counter() - started)
+        return counts
+
+    def reject(self, line_number, job, error):
+        self.counts['rejected'] += 1
+        self.rejects.write(json.dumps({'line': line_number, 'error': error, 'job': job}) + '\n')
+
+    def run_chunk(self, chunk):
+        if not chunk:
+            return
+        orders = []
+        with self.storage.transaction():
+            with self.inventory.batch():
+                for line_number, job in chunk:
+                    op = job.get('op')
+                    try:
+                        # A nested batch undoes whatever a failed job changed.
+                        with self.inventory.batch():
+                            if op == 'order':
+                                orders.append(self.stage_order(job))
+                            elif op == 'upsert':
+                                self.upsert(job)
+                            elif op == 'delete':
+                                self.delete(job)
+                            else:
+                                raise JobError(f"unknown op {op!r}")
+                    except JobError as e:
+                        self.reject(line_number, job, str(e))
+                        continue
+                    except Exception as e:
+                        self.reject(line_number, job, f"{type(e).__name__}: {e}")
+                        continue
+                    self.counts[op] += 1
+            if orders:
+                self.order_manager.record_staged_sales(
+                    [(sale_record, stock_before) for sale_record, stock_before, _ in orders])
+
+        order_manager = self.order_manager
+        for sale_record, stock_before, cart in orders:
+            order_manager.cart = cart
+            bill = order_manager.complete_order(sale_record, stock_before)
+            if self.bill_writer is not None:
+                self.bill_writer.submit(bill, sale_record['order_id'], sale_record['datetime'],
+                                        self.bill_format)
+        # Only the latest orders are kept in memory.
+        del order_manager.sales_records[:]
+        if self.velocity is not None and orders:
+            self.velocity.record_sales([sale_record for sale_record, _, _ in orders])
+
+    def stage_order(self, job):
+        items = job.get('items')
+        if not isinstance(items, list) or not items:
+            raise JobError("order needs a non-empty items list")
+        discount = number(job, 'discount', float, 0)
+        if not 0 <= discount <= 100:
+            raise JobError("discount must be between 0 and 100")
+
+        order_manager = self.order_manager
+        order_manager.cart = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise JobError("each item needs product_id and quantity")
+            product_id = text(item, 'product_id')
+            quantity = number(item, 'quantity', int)
+            if quantity <= 0:
+                raise JobError(f"quantity for {product_id} must be positive")
+            if self.inventory.get_product(product_id) is None:
+                raise JobError(f"unknown product {product_id}")
+            if not order_manager.add_to_cart(product_id, quantity):
+                raise JobError(f"not enough stock of {product_id}")
+        staged = order_manager.stage_order(discount)
+        if not staged:
+            raise JobError(f"{order_manager.order_error()} for the whole order")
+        # The bill is built after the chunk commits; later jobs in the
+        # chunk may reprice or delete these products.
+        cart = [dict(item, product=Product(item['product_id'], item['product'].name,
+                                           item['product'].price, item['product'].quantity))
+                for item in order_manager.cart]
+        return staged + (cart,)
+
+    def upsert(self, job):
+        product_id = text(job, 'product_id')
+        if not product_id:
+            raise JobError("upsert needs a product_id")
+        name = text(job, 'name')
+        price = number(job, 'price', float, None)
+        quantity = number(job, 'quantity', int, None)
+        if price is not None and price < 0 or quantity is not None and quantity < 0:
+            raise JobError("price and quantity cannot be negative")
+        if self.inventory.get_product(product_id) is not None:
+            self.inventory.update_product(product_id, name or None, price, quantity)
+            return
+        if not name or price is None or quantity is None:
+            raise JobError(f"new product {product_id} needs name, price and quantity")
+        self.inventory.add_product(product_id, name, price, quantity)
+
+    def delete(self, job):
+        product_id = text(job, 'product_id')
+        if not self.inventory.delete_product(product_id):
+            raise JobError(f"unknown product {product_id}")
+
+    def run_report(self, line_number, job):
+        try:
+            report = job.get('report')
+            if report not in self.reports:
+                raise JobError(f"unknown report {report!r}; expected one of "
+                               f"{', '.join(self.reports)}")
+            filename, header, rows = getattr(self, f"{report}_report")(job)
+        except JobError as e:
+            self.reject(line_number, job, str(e))
+            return
+        except Exception as e:
+            self.reject(line_number, job, f"{type(e).__name__}: {e}")
+            return
+        filename = job.get('output') or filename
+        if self.executor is not None:
+            self.exports.append((filename, self.executor.submit(write_csv, filename, header, rows)))
+        else:
+            write_csv(filename, header, rows)
+        self.counts['report'] += 1
+
+    def daily_sales_report(self, job):
+        day = parse_date(job, 'date', date.today())
+        report = self.order_manager.get_daily_sales(day)
+        return (f"daily_sales_report_{day}.csv",
+                ["Date", "Total Orders", "Total Items Sold", "Total Sales Amount"],
+                [[day, report['num_orders'], report['total_items'],
+                  f"{report['total_sales']:.2f}"]])
+
+    def sales_range_report(self, job):
+        end_date = parse_date(job, 'end', date.today())
+        start_date = parse_date(job, 'start', end_date - timedelta(days=29))
+        days = self.order_manager.get_sales_range(start_date, end_date)
+        return (f"sales_range_report_{start_date}_{end_date}.csv",
+                ["Date", "Total Orders", "Total Items Sold", "Total Sales Amount"],
+                [[day['date'], day['num_orders'], day['total_items'],
+                  f"{day['total_sales']:.2f}"] for day in days])
+
+    def low_stock_report(self, job):
+        threshold = number(job, 'threshold', int, 5)
+        return (f"low_stock_report_{date.today()}.csv", ["Product ID", "Name", "Stock"],
+                [[product.product_id, product.name, product.quantity]
+                 for product in self.inventory.get_low_stock_products(threshold)])
+
+    def reorder_report(self, job):
+        if self.velocity is None:
+            raise JobError("reorder report needs sales velocity tracking")
+        limit = number(job, 'limit', int, 10)
+        days = number(job, 'days', int, 14)
+        today = date.today()
+        rows = []
+        for product, rate, cover in self.velocity.reorder_suggestions(limit):
+            rows.append([product.product_id, product.name, product.quantity, f"{rate:.2f}",
+                         f"{cover:.1f}", today + timedelta(days=min(cover, 36500)),
+                         max(0, round(rate * days - product.quantity))])
+        return (f"reorder_report_{today}.csv",
+                ["Product ID", "Name", "Stock", "Units Per Day", "Days of Cover",
+                 "Projected Stock-out", f"Reorder Qty ({days} days)"], rows)
+
+    def product_sales_report(self, job):
+        try:
+            from sales_analytics import SalesAnalytics
+            analytics = SalesAnalytics(self.storage, self.storage.analytics_cache)
+        except ImportError as e:
+            raise JobError(str(e))
+        analytics.refresh()
+        end_date = parse_date(job, 'end', date.today())
+        start_date = parse_date(job, 'start', end_date - timedelta(days=29))
+        by = 'units' if job.get('by') == 'units' else 'total_sales'
+        rows = []
+        for product_id, units, total_sales in analytics.product_breakdown(
+                start_date, end_date, number(job, 'limit', int, None), by):
+            product = self.inventory.get_product(product_id)
+            rows.append([product_id, product.name if product else '', units,
+                         f"{total_sales:.2f}"])
+        return (f"product_sales_report_{start_date}_{end_date}.csv",
+                ["Product ID", "Name", "Units Sold", "Total Sales Amount"], rows)
+
+def text(job, field):
+    value = job.get(field)
+    if value is not None and not isinstance(value, str):
+        raise JobError(f"{field} must be a string, not {value!r}")
+    return value
+
+def number(job, field, kind, default=JobError):
+    value = job.get(field)
+    if value is None or value == '':
+        if default is JobError:
+            raise JobError(f"missing {field}")
+        return default
+    try:
+        result = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        raise JobError(f"invalid {field}: {value!r}")
+    if kind is int and result != value and str(result) != str(value).strip():
+        raise JobError(f"invalid {field}: {value!r}")
+    # Stock is stored as int64, and NaN or infinity would pass every range check.
+    if kind is int and not -2 ** 63 <= result < 2 ** 63:
+        raise JobError(f"{field} out of range: {value!r}")
+    if kind is float and not math.isfinite(result):
+        raise JobError(f"invalid {field}: {value!r}")
+    return result
+
+def parse_date(job, field, default):
+    value = job.get(field)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        raise JobError(f"invalid {field} {value!r}; use YYYY-MM-DD")
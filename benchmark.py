@@ -0,0 +1,275 @@
+"""
+Benchmarks for the inventory and order hot paths
+"""
+
+import argparse
+import csv
+from datetime import date, datetime, timedelta
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from inventory_backend import InventoryManager, OrderManager
+from inventory_storage import CSVStorage, SQLiteStorage, migrate_csv_to_sqlite
+from sales_line_items import LineItemLog
+from sales_store import SalesStore
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+WORDS = ['steel', 'cotton', 'blue', 'red', 'large', 'small', 'premium', 'basic',
+         'widget', 'gadget', 'bolt', 'shirt', 'lamp', 'cable', 'box', 'pack']
+
+def product_name(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(3)) + f" {rng.randrange(10000)}"
+
+def generate_catalog(filename, count, seed=0):
+    rng = random.Random(seed)
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['product_id', 'name', 'price', 'quantity'])
+        for i in range(count):
+            writer.writerow([f"P{i:07d}", product_name(rng),
+                             round(rng.uniform(1, 500), 2), rng.randrange(0, 200)])
+
+def generate_sales(filename, count, days=365, seed=0):
+    """Write ``count`` orders spread evenly over the ``days`` up to today."""
+    rng = random.Random(seed)
+    start = datetime.combine(date.today() - timedelta(days=days - 1), datetime.min.time())
+    step = timedelta(days=days) / max(count, 1)
+    with open(filename, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['order_id', 'datetime', 'items', 'total'])
+        order_time = start
+        for i in range(count):
+            writer.writerow([f"H{i:010d}", order_time.isoformat(sep=' '),
+                             rng.randrange(1, 6), round(rng.uniform(5, 2000), 2)])
+            order_time += step
+
+def csv_storage(directory):
+    return CSVStorage(os.path.join(directory, 'inventory.csv'), journal=True,
+                      sales_file=os.path.join(directory, 'sales_records.csv'),
+                      sales_store=SalesStore(os.path.join(directory, 'data', 'sales')),
+                      line_item_log=LineItemLog(os.path.join(directory, 'sales_line_items.csv')))
+
+def make_storage(directory, storage):
+    if storage == 'sqlite':
+        return SQLiteStorage(os.path.join(directory, 'data', 'inventory.db'))
+    return csv_storage(directory)
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        'benchmark': name,
+        'ops': len(timings),
+        'total_s': total,
+        'mean_ms': total / len(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    }
+
+def timed(function, arguments):
+    timings = []
+    for args in arguments:
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def time_to_menu(directory, storage):
+    """Seconds from starting ``main.py`` in ``directory`` to its first menu."""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, MAIN, '--storage', storage], cwd=directory,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    output = ''
+    while 'Enter your choice' not in output:
+        char = process.stdout.read(1)
+        if not char:
+            raise RuntimeError(f"main.py exited before its menu: {output[-500:]}")
+        output += char
+    elapsed = time.perf_counter() - started
+    process.communicate('4\n')
+    return elapsed
+
+def run_size(directory, products, orders, storage, ops, seed=0):
+    """Benchmark one catalog size in a fresh directory; returns result dicts."""
+    rng = random.Random(seed)
+    results = []
+    def record(name, timings):
+        result = summarize(name, timings)
+        result.update({'products': products, 'orders': orders, 'storage': storage})
+        results.append(result)
+        print(f"  {name:<24}{result['ops']:>7} ops  mean {result['mean_ms']:10.3f} ms  "
+              f"p99 {result['p99_ms']:10.3f} ms", flush=True)
+
+    # Build the data set outside the timings.
+    generate_catalog(os.path.join(directory, 'inventory.csv'), products, seed)
+    generate_sales(os.path.join(directory, 'sales_records.csv'), orders, seed=seed)
+    started = time.perf_counter()
+    setup = csv_storage(directory)
+    setup.prepare_sales(iter(()))
+    if storage == 'sqlite':
+        migrate_csv_to_sqlite(setup, make_storage(directory, storage))
+    record('build_sales_store', [time.perf_counter() - started])
+
+    # The first start parses inventory.csv and writes the snapshot cache;
+    # later starts load the cache.
+    record('startup_cold', [time_to_menu(directory, storage)])
+    record('startup_warm', [time_to_menu(directory, storage) for _ in range(3)])
+
+    manager = None
+    def load():
+        nonlocal manager
+        manager = InventoryManager(storage=make_storage(directory, storage))
+    record('load_inventory', timed(load, [()] * 3))
+    record('save_inventory', timed(manager.save_inventory, [()] * 3))
+
+    ids = [f"P{rng.randrange(products):07d}" for _ in range(ops)]
+    new_ids = [f"N{i:07d}" for i in range(ops)]
+    record('add_product', timed(manager.add_product,
+                                [(product_id, product_name(rng), 9.99, 50)
+                                 for product_id in new_ids]))
+    record('update_product', timed(manager.update_product,
+                                   [(product_id, None, None, rng.randrange(0, 200))
+                                    for product_id in ids]))
+    record('delete_product', timed(manager.delete_product, [(product_id,) for product_id in new_ids]))
+    record('search_product_id', timed(lambda product_id: manager.search_product(product_id=product_id),
+                                      [(product_id,) for product_id in ids]))
+    record('search_name_first', timed(lambda name: manager.search_product(name=name, limit=101),
+                                      [('premium',)]))
+    queries = [(rng.choice(WORDS)[:rng.randrange(3, 6)],) for _ in range(ops)]
+    record('search_product_name', timed(lambda name: manager.search_product(name=name, limit=101),
+                                        queries))
+    record('get_low_stock', timed(manager.get_low_stock_products,
+                                  [(threshold,) for threshold in (0, 5, 10, 50)] * 5))
+
+    order_manager = OrderManager(manager)
+    def add_to_cart(product_id):
+        order_manager.add_to_cart(product_id, 1)
+        order_manager.cart.clear()
+    record('add_to_cart', timed(add_to_cart, [(product_id,) for product_id in ids]))
+
+    def process_order(product_ids):
+        for product_id in product_ids:
+            order_manager.add_to_cart(product_id, 1)
+        order_manager.process_order()
+        order_manager.cart.clear()
+    in_stock = [product.product_id for product in manager.products if product.quantity >= 20]
+    record('process_order', timed(process_order,
+                                  [(rng.sample(in_stock, 3),) for _ in range(min(ops, 1000))]))
+    days = [(date.today() - timedelta(days=rng.randrange(365)),) for _ in range(ops)]
+    record('get_daily_sales', timed(order_manager.get_daily_sales, days))
+    manager.compact()
+    return results
+
+def compare_results(baseline, current, tolerance=0.2):
+    """Pair up results by (benchmark, products, orders, storage) and return
+    ``(rows, regressions)`` where each row is ``(key, old_ms, new_ms, ratio)``.
+
+    The median is compared rather than the mean, so one slow outlier (a
+    journal compaction, a GC pause) does not read as a regression."""
+    def key(result):
+        return (result['benchmark'], result['products'], result['orders'], result['storage'])
+    old = {key(result): result for result in baseline['results']}
+    rows, regressions = [], []
+    for result in current['results']:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        row = (key(result), before['p50_ms'], result['p50_ms'], ratio)
+        rows.append(row)
+        if ratio > 1 + tolerance:
+            regressions.append(row)
+    return rows, regressions
+
+def print_comparison(rows, regressions, tolerance):
+    print(f"\n{'benchmark':<24}{'products':>10}{'storage':>8}{'baseline p50':>14}"
+          f"{'current p50':>14}{'ratio':>8}")
+    for (name, products, orders, storage), old_ms, new_ms, ratio in rows:
+        flag = '  REGRESSION' if ratio > 1 + tolerance else ''
+        print(f"{name:<24}{products:>10}{storage:>8}{old_ms:>14.3f}{new_ms:>14.3f}"
+              f"{ratio:>8.2f}{flag}")
+    print(f"\n{len(regressions)} regression(s) beyond {tolerance:.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inventory and order hot paths")
+    parser.add_argument('--products', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="catalog sizes to benchmark (e.g. 1000 1000000)")
+    parser.add_argument('--orders', type=int, default=100000,
+                        help="orders in the generated sales history")
+    parser.add_argument('--ops', type=int, default=1000, help="operations per timed benchmark")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against a saved results file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="only compare two saved results files")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown before flagging a regression (0.2 = 20%%)")
+    parser.add_argument('--workdir', help="directory for generated data (default: a temp dir)")
+    parser.add_argument('--startup-target', type=float,
+                        help="fail if a warm start (main.py to first menu) takes longer, in seconds")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as file:
+            baseline = json.load(file)
+        with open(args.compare[1]) as file:
+            current = json.load(file)
+        rows, regressions = compare_results(baseline, current, args.tolerance)
+        print_comparison(rows, regressions, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    current = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'storage': args.storage,
+            'ops': args.ops
+        },
+        'results': []
+    }
+    root = args.workdir or tempfile.mkdtemp(prefix='inventory-bench-')
+    try:
+        for products in args.products:
+            directory = os.path.join(root, f"{args.storage}-{products}")
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            print(f"{products} products, {args.orders} orders ({args.storage})", flush=True)
+            current['results'].extend(
+                run_size(directory, products, args.orders, args.storage, args.ops))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    failed = False
+    if args.startup_target is not None:
+        for result in current['results']:
+            if result['benchmark'] == 'startup_warm':
+                ok = result['p50_ms'] <= args.startup_target * 1000
+                failed = failed or not ok
+                print(f"Startup with {result['products']} products: {result['p50_ms'] / 1000:.2f}s "
+                      f"(target {args.startup_target:.2f}s) {'ok' if ok else 'TOO SLOW'}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        rows, regressions = compare_results(baseline, current, args.tolerance)
+        print_comparison(rows, regressions, args.tolerance)
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
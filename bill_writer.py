@@ -0,0 +1,190 @@
+"""
+Background bill rendering and writing
+"""
+
+import os
+import queue
+import threading
+import time
+
+from metrics import metrics
+
+class PDFBillTemplate:
+    """Page layout for PDF bills, set up once and reused for every bill.
+
+    fpdf is imported here rather than at module level, so text bills work
+    without it installed.
+    """
+
+    font = 'Courier'
+    font_size = 10
+    line_height = 5
+    margin = 15
+
+    def __init__(self):
+        from fpdf import FPDF
+
+        template = self
+
+        class BillPDF(FPDF):
+            def __init__(self):
+                super().__init__(orientation='P', unit='mm', format='A4')
+                self.set_margins(template.margin, template.margin)
+                self.set_auto_page_break(True, template.margin)
+
+        self.document_class = BillPDF
+
+    def render(self, bill_content, filename):
+        pdf = self.document_class()
+        pdf.add_page()
+        pdf.set_font(self.font, size=self.font_size)
+        for line in bill_content.split('\n'):
+            # The core fonts only cover Latin-1.
+            pdf.cell(0, self.line_height, line.encode('latin-1', 'replace').decode('latin-1'))
+            pdf.ln(self.line_height)
+        pdf.output(filename)
+
+def write_bill(filename, bill_content, filetype='txt', pdf_template=None):
+    # Timed inline rather than with @timed: other modules import this
+    # function by name, so swapping the module attribute would miss them.
+    started = time.perf_counter()
+    if filetype == 'pdf':
+        (pdf_template or PDFBillTemplate()).render(bill_content, filename)
+    else:
+        with open(filename, 'w') as file:
+            file.write(bill_content)
+    if metrics.enabled:
+        metrics.observe('bills.write', time.perf_counter() - started)
+        metrics.record_io(os.path.join(os.path.dirname(filename), '*.' + filetype),
+                          bytes_written=os.path.getsize(filename), rows_written=1)
+
+def bill_path(directory, order_id, order_time, filetype='txt'):
+    day_dir = os.path.join(directory, order_time.strftime('%Y-%m'),
+                           order_time.strftime('%Y-%m-%d'))
+    return os.path.join(day_dir, f"bill_{order_id}.{filetype}")
+
+# One PDF layout per worker process, set up by its first PDF bill.
+process_pdf_template = None
+
+def save_bill(filename, bill_content, filetype='txt'):
+    """Write one bill, creating its day directory; runs in worker processes."""
+    global process_pdf_template
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    pdf_template = None
+    if filetype == 'pdf':
+        if process_pdf_template is None:
+            process_pdf_template = PDFBillTemplate()
+        pdf_template = process_pdf_template
+    write_bill(filename, bill_content, filetype, pdf_template)
+
+class BillWriter:
+    """Write bills from a pool of worker threads.
+
+    ``submit`` returns the bill's path at once and queues the write, so a
+    checkout does not wait for the bill file. The queue is bounded
+    (``max_pending``); when the workers fall behind, ``submit`` blocks
+    rather than letting unwritten bills pile up in memory, or with
+    ``block=False`` raises ``queue.Full`` so the caller can wait for room
+    somewhere else. Bills land in
+    ``bills/YYYY-MM/YYYY-MM-DD/``. ``flush`` waits for everything submitted
+    so far to be written.
+    """
+
+    def __init__(self, directory='bills', workers=2, max_pending=1000):
+        self.directory = directory
+        self.pending = queue.Queue(max_pending)
+        self.errors = []
+        self.pdf_template = None
+        self.template_lock = threading.Lock()
+        self.workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self.run_worker, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def bill_path(self, order_id, order_time, filetype='txt'):
+        return bill_path(self.directory, order_id, order_time, filetype)
+
+    def submit(self, bill_content, order_id, order_time, filetype='txt', block=True):
+        filename = self.bill_path(order_id, order_time, filetype)
+        self.pending.put((filename, bill_content, filetype), block)
+        return filename
+
+    def get_pdf_template(self):
+        with self.template_lock:
+            if self.pdf_template is None:
+                self.pdf_template = PDFBillTemplate()
+            return self.pdf_template
+
+    def run_worker(self):
+        while True:
+            job = self.pending.get()
+            try:
+                if job is None:
+                    return
+                filename, bill_content, filetype = job
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                pdf_template = self.get_pdf_template() if filetype == 'pdf' else None
+                write_bill(filename, bill_content, filetype, pdf_template)
+            except Exception as e:
+                self.errors.append((job[0], e))
+            finally:
+                self.pending.task_done()
+
+    def flush(self):
+        """Wait until every submitted bill is written. Returns the
+        ``(filename, exception)`` pairs for bills that failed since the last
+        flush."""
+        self.pending.join()
+        errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        errors = self.flush()
+        for _ in self.workers:
+            self.pending.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        return errors
+
+class PooledBillWriter:
+    """``BillWriter`` with the writes done by a process pool, so rendering
+    (PDF especially) runs on other cores. ``executor`` is a
+    ``concurrent.futures`` executor owned by the caller; ``close`` does not
+    shut it down. At most ``max_pending`` bills are in flight.
+    """
+
+    def __init__(self, executor, directory='bills', max_pending=1000):
+        self.executor = executor
+        self.directory = directory
+        self.max_pending = max_pending
+        self.pending = []
+        self.errors = []
+
+    def bill_path(self, order_id, order_time, filetype='txt'):
+        return bill_path(self.directory, order_id, order_time, filetype)
+
+    def submit(self, bill_content, order_id, order_time, filetype='txt'):
+        filename = self.bill_path(order_id, order_time, filetype)
+        if len(self.pending) >= self.max_pending:
+            self.collect(self.pending[:len(self.pending) // 2])
+        self.pending.append((filename, self.executor.submit(save_bill, filename, bill_content,
+                                                            filetype)))
+        return filename
+
+    def collect(self, jobs):
+        for filename, future in jobs:
+            try:
+                future.result()
+            except Exception as e:
+                self.errors.append((filename, e))
+        del self.pending[:len(jobs)]
+
+    def flush(self):
+        self.collect(list(self.pending))
+        errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        return self.flush()
@@ -0,0 +1,116 @@
+"""
+Load generator for the checkout service
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from checkout_service import CheckoutService
+
+class CheckoutClient:
+    """One POS connection speaking the service's line-delimited JSON."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(
+            host, port, limit=CheckoutService.line_limit)
+        return cls(reader, writer)
+
+    async def call(self, op, **params):
+        params['op'] = op
+        self.writer.write(json.dumps(params).encode('utf-8') + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_client(host, port, product_ids, orders, items_per_order, latencies, failures):
+    client = await CheckoutClient.connect(host, port)
+    try:
+        for _ in range(orders):
+            # Latency covers the whole order: filling the cart and checkout.
+            started = time.perf_counter()
+            for product_id in random.sample(product_ids, min(items_per_order, len(product_ids))):
+                await client.call('add_to_cart', product_id=product_id, quantity=1)
+            response = await client.call('checkout')
+            if response['ok']:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures.append(response['error'])
+                for item in (await client.call('view_cart'))['items']:
+                    await client.call('remove_from_cart', product_id=item['product_id'])
+    finally:
+        await client.close()
+
+async def run_load(host, port, clients, orders, items_per_order, products):
+    client = await CheckoutClient.connect(host, port)
+    listed = await client.call('list_products', limit=products)
+    before = await client.call('stats')
+    await client.close()
+    product_ids = [product['product_id'] for product in listed['products']
+                   if product['quantity'] > 0]
+    if not product_ids:
+        raise SystemExit("The service has no products in stock.")
+
+    latencies, failures = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, product_ids, orders, items_per_order,
+                                      latencies, failures)
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    client = await CheckoutClient.connect(host, port)
+    after = await client.call('stats')
+    await client.close()
+
+    latencies.sort()
+    commits = after['commits'] - before['commits']
+    return {
+        'clients': clients,
+        'orders': len(latencies),
+        'failed': len(failures),
+        'seconds': elapsed,
+        'orders_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'commits': commits,
+        'orders_per_commit': (after['orders'] - before['orders']) / commits if commits else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the checkout service with concurrent POS clients")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--clients', type=int, default=50, help="concurrent connections")
+    parser.add_argument('--orders', type=int, default=100, help="orders per client")
+    parser.add_argument('--items', type=int, default=3, help="products per order")
+    parser.add_argument('--products', type=int, default=1000,
+                        help="how many catalog products to pick from")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.host, args.port, args.clients, args.orders,
+                                  args.items, args.products))
+    print(f"{result['orders']} orders from {result['clients']} clients in "
+          f"{result['seconds']:.2f}s ({result['failed']} failed)")
+    print(f"Throughput: {result['orders_per_sec']:.1f} orders/sec")
+    print(f"Latency: p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    print(f"Group commits: {result['commits']} "
+          f"({result['orders_per_commit']:.1f} orders per commit)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Asyncio checkout service: JSON over TCP for many POS clients
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import json
+import os
+import queue
+import signal
+
+from batch_jobs import JobError, number
+from bill_writer import BillWriter
+from inventory_backend import InventoryManager, OrderManager
+from inventory_storage import CSVStorage, SQLiteStorage
+from metrics import metrics
+from sales_velocity import SalesVelocity
+
+class CheckoutService:
+    """Serve cart, order, search and report operations to many clients.
+
+    Clients send one JSON object per line, e.g.
+    ``{"op": "add_to_cart", "product_id": "P1", "quantity": 2}``, and get one
+    JSON object per line back, always with an ``ok`` field. Every connection
+    has its own cart (its own ``OrderManager``).
+
+    Checkouts are group-committed: the first order opens a short window
+    (``commit_window`` seconds), every order that arrives during it joins the
+    group, and the whole group is staged in one inventory batch and recorded
+    with one ``record_sales`` call. That is one journal append and one sales
+    append per file, each fsynced, or one SQLite commit (``synchronous=FULL``)
+    for the group instead of one per order, and a client only gets its reply
+    once its order is on disk. An order that cannot be filled is rejected on
+    its own; the rest of the group commits.
+
+    A group is committed on a single store thread, so the file I/O, fsyncs
+    and storage lock never block the event loop. ``catalog_lock`` is held
+    while a group commits; operations that read the catalog or the sales
+    files take it too, so the catalog is never touched by two operations at
+    once. With a ``bill_writer``, each bill is
+    queued for writing after the group commits; the client gets its reply
+    without waiting for the file. With a ``velocity`` (``SalesVelocity``),
+    each group's sales are added to it in one update.
+    """
+
+    # Longest request or response line; a page of products can exceed the
+    # asyncio default of 64 KiB.
+    line_limit = 16 * 1024 * 1024
+
+    def __init__(self, inventory_manager, commit_window=0.002, max_batch=256,
+                 bill_writer=None, bill_format='txt', velocity=None):
+        self.inventory = inventory_manager
+        self.bill_writer = bill_writer
+        self.velocity = velocity
+        self.bill_format = bill_format
+        self.storage = inventory_manager.storage
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.pending = None
+        self.catalog_lock = None
+        # One thread, so the storage (and a SQLite connection) is only ever
+        # used from one thread besides the loop, never concurrently.
+        self.store_thread = ThreadPoolExecutor(1, thread_name_prefix='checkout-store')
+        self.commits = 0
+        self.committed_orders = 0
+        self.operations = {
+            'search': self.search,
+            'list_products': self.list_products,
+            'add_to_cart': self.add_to_cart,
+            'remove_from_cart': self.remove_from_cart,
+            'view_cart': self.view_cart,
+            'checkout': self.checkout,
+            'daily_sales': self.daily_sales,
+            'low_stock': self.low_stock,
+            'stats': self.stats,
+        }
+        # Everything but these reads the catalog or the sales files.
+        self.unlocked_operations = {'remove_from_cart', 'checkout', 'stats'}
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        self.pending = asyncio.Queue()
+        self.catalog_lock = asyncio.Lock()
+        committer = asyncio.create_task(self.commit_loop())
+        server = await asyncio.start_server(self.handle_client, host, port,
+                                            limit=self.line_limit)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            committer.cancel()
+            # Let a group that is being committed finish before shutting down.
+            self.store_thread.shutdown()
+
+    async def handle_client(self, reader, writer):
+        try:
+            # OrderManager prepares the sales files under the storage lock,
+            # so it is built on the store thread, between group commits.
+            order_manager = await asyncio.get_running_loop().run_in_executor(
+                self.store_thread, OrderManager, self.inventory)
+        except Exception:
+            writer.close()
+            raise
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    operation = self.operations.get(request.get('op'))
+                    if operation is None:
+                        response = {'ok': False, 'error': f"unknown op {request.get('op')!r}"}
+                    elif request['op'] in self.unlocked_operations:
+                        response = await operation(order_manager, request)
+                    else:
+                        async with self.catalog_lock:
+                            response = await operation(order_manager, request)
+                except (ValueError, TypeError, KeyError, JobError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def checkout(self, order_manager, request):
+        if not order_manager.cart:
+            return {'ok': False, 'error': 'cart is empty'}
+        discount = number(request, 'discount', float, 0)
+        if not 0 <= discount <= 100:
+            return {'ok': False, 'error': 'discount must be between 0 and 100'}
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((order_manager, discount, future))
+        try:
+            bill = await future
+        except Exception as e:
+            return {'ok': False, 'error': f"order not recorded: {e}"}
+        if not bill:
+            return {'ok': False, 'error': order_manager.order_error()}
+        sale_record = order_manager.sales_records[-1]
+        response = {'ok': True, 'order_id': sale_record['order_id'],
+                    'total': sale_record['total'], 'bill': bill}
+        if self.bill_writer is not None:
+            response['bill_file'] = await self.submit_bill(bill, sale_record)
+        return response
+
+    async def submit_bill(self, bill, sale_record):
+        """Queue the bill's write; when the queue is full, wait for room on
+        a worker thread, so only this client is held back, not the loop."""
+        args = (bill, sale_record['order_id'], sale_record['datetime'], self.bill_format)
+        try:
+            return self.bill_writer.submit(*args, block=False)
+        except queue.Full:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.bill_writer.submit, *args)
+
+    async def commit_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            group = [await self.pending.get()]
+            if self.commit_window:
+                await asyncio.sleep(self.commit_window)
+            while len(group) < self.max_batch and not self.pending.empty():
+                group.append(self.pending.get_nowait())
+            async with self.catalog_lock:
+                try:
+                    bills = await loop.run_in_executor(self.store_thread, self.commit_group,
+                                                       [entry[:2] for entry in group])
+                except Exception as e:
+                    for order_manager, discount, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+            for (order_manager, discount, future), bill in zip(group, bills):
+                if not future.done():
+                    future.set_result(bill)
+
+    def commit_group(self, group):
+        """Stage and record ``(order_manager, discount)`` orders together;
+        runs on the store thread. Returns each order's bill, or False for an
+        order that could not be filled."""
+        staged = []
+        with self.storage.transaction():
+            with self.inventory.batch():
+                for order_manager, discount in group:
+                    staged.append(order_manager.stage_order(discount))
+            recorded = [result for result in staged if result]
+            if recorded:
+                group[0][0].record_staged_sales(recorded)
+            sale_records = [sale_record for sale_record, _ in recorded]
+
+        self.commits += 1
+        self.committed_orders += len(sale_records)
+        if self.velocity is not None:
+            self.velocity.record_sales(sale_records)
+        return [order_manager.complete_order(*result) if result else False
+                for (order_manager, discount), result in zip(group, staged)]
+
+    async def search(self, order_manager, request):
+        results = self.inventory.search_product(
+            product_id=request.get('product_id'), name=request.get('name'),
+            limit=request.get('limit', 100))
+        return {'ok': True, 'products': [product_dict(product) for product in results]}
+
+    async def list_products(self, order_manager, request):
+        offset = int(request.get('offset', 0))
+        limit = int(request.get('limit', 100))
+        products = []
+        for product in self.inventory.products:
+            if offset:
+                offset -= 1
+                continue
+            if len(products) == limit:
+                break
+            products.append(product_dict(product))
+        return {'ok': True, 'products': products}
+
+    async def add_to_cart(self, order_manager, request):
+        quantity = number(request, 'quantity', int)
+        if quantity <= 0:
+            return {'ok': False, 'error': 'quantity must be positive'}
+        if not order_manager.add_to_cart(request['product_id'], quantity):
+            return {'ok': False, 'error': 'product not found or insufficient stock'}
+        return {'ok': True}
+
+    async def remove_from_cart(self, order_manager, request):
+        if not order_manager.remove_from_cart(request['product_id']):
+            return {'ok': False, 'error': 'product not in cart'}
+        return {'ok': True}
+
+    async def view_cart(self, order_manager, request):
+        return {
+            'ok': True,
+            'items': [{'product_id': item['product_id'],
+                       'name': item['product'].name,
+                       'quantity': item['quantity'],
+                       'subtotal': item['subtotal']} for item in order_manager.cart],
+            'total': order_manager.calculate_total()
+        }
+
+    async def daily_sales(self, order_manager, request):
+        day = date.fromisoformat(request['date']) if request.get('date') else None
+        report = await asyncio.get_running_loop().run_in_executor(
+            self.store_thread, order_manager.get_daily_sales, day)
+        report['date'] = report['date'].isoformat()
+        return {'ok': True, 'report': report}
+
+    async def low_stock(self, order_manager, request):
+        products = self.inventory.get_low_stock_products(int(request.get('threshold', 5)))
+        return {'ok': True, 'products': [product_dict(product) for product in products]}
+
+    async def stats(self, order_manager, request):
+        return {'ok': True, 'commits': self.commits, 'orders': self.committed_orders}
+
+def product_dict(product):
+    return {'product_id': product.product_id, 'name': product.name,
+            'price': product.price, 'quantity': product.quantity}
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkout service for POS clients")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--storage', choices=['csv', 'sqlite'],
+                        default=os.environ.get('INVENTORY_STORAGE', 'csv'))
+    parser.add_argument('--database', default=os.path.join('data', 'inventory.db'))
+    parser.add_argument('--commit-window', type=float, default=0.002,
+                        help="seconds to wait for more orders before a group commit")
+    parser.add_argument('--max-batch', type=int, default=256,
+                        help="most orders committed together")
+    parser.add_argument('--save-bills', choices=['txt', 'csv', 'pdf'],
+                        help="write every bill under bills/ in this format")
+    parser.add_argument('--metrics-file',
+                        help="collect metrics and dump them to this file (.prom or JSON)")
+    parser.add_argument('--metrics-interval', type=float, default=60)
+    args = parser.parse_args()
+
+    if args.metrics_file:
+        metrics.enable()
+        metrics.start_dumping(args.metrics_file, args.metrics_interval)
+    if args.storage == 'csv':
+        storage = CSVStorage(journal=True)
+    else:
+        # Groups are committed on the service's store thread.
+        storage = SQLiteStorage(args.database, check_same_thread=False)
+    inventory_manager = InventoryManager(storage=storage)
+    bill_writer = BillWriter() if args.save_bills else None
+    velocity = SalesVelocity(inventory_manager)
+    service = CheckoutService(inventory_manager, args.commit_window, args.max_batch,
+                              bill_writer, args.save_bills, velocity)
+    print(f"Checkout service listening on {args.host}:{args.port} "
+          f"({len(inventory_manager.products)} products)")
+    # Stop on SIGTERM as on Ctrl+C, so the journal is still compacted.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inventory_manager.compact()
+        velocity.save()
+        if bill_writer is not None:
+            for filename, error in bill_writer.close():
+                print(f"Could not save bill {filename}: {error}")
+        metrics.stop_dumping()
+
+if __name__ == "__main__":
+    main()
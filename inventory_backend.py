@@ -1,95 +1,573 @@
+from array import array
+import bisect
+from collections import defaultdict
+from contextlib import contextmanager
 import csv
 from datetime import datetime
-import os
+import sys
+
+from bill_writer import write_bill
+from inventory_storage import CSVStorage, InventoryJournal
+from metrics import timed
+from order_ids import default_generator
 
 class Product:
+    __slots__ = ('product_id', 'name', 'price', 'quantity')
+
     def __init__(self, product_id, name, price, quantity):
         self.product_id = product_id
         self.name = name
         self.price = price
         self.quantity = quantity
 
+class ProductView:
+    """Read-only, Product-like handle on one row of a ProductCatalog.
+
+    Changes go through InventoryManager so its indexes stay in sync.
+    """
+
+    __slots__ = ('catalog', 'row')
+
+    def __init__(self, catalog, row):
+        self.catalog = catalog
+        self.row = row
+
+    @property
+    def product_id(self):
+        return self.catalog.ids[self.row]
+
+    @property
+    def name(self):
+        return self.catalog.names[self.row]
+
+    @property
+    def price(self):
+        return self.catalog.prices[self.row]
+
+    @property
+    def quantity(self):
+        return self.catalog.quantities[self.row]
+
+    def __eq__(self, other):
+        return (isinstance(other, ProductView) and
+                self.catalog is other.catalog and self.row == other.row)
+
+    def __hash__(self):
+        return hash((id(self.catalog), self.row))
+
+    def __repr__(self):
+        return (f"ProductView({self.product_id!r}, {self.name!r}, "
+                f"{self.price!r}, {self.quantity!r})")
+
+class ProductCatalog:
+    """Columnar product storage: ids and names in plain lists (names parsed
+    from CSV are interned), prices and quantities in typed arrays, one row
+    per product.
+
+    Rows are append-only, so row order is catalog order. Deleting a product
+    blanks its id and leaves the row in place, which keeps every other row
+    number (and any ProductView already handed out) valid; the gaps go away
+    the next time the catalog is loaded from disk.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.prices = array('d')
+        self.quantities = array('q')
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for row, product_id in enumerate(self.ids):
+            if product_id is not None:
+                yield ProductView(self, row)
+
+    def get(self, product_id):
+        row = self.rows.get(product_id)
+        return None if row is None else ProductView(self, row)
+
+    def append(self, product_id, name, price, quantity):
+        row = len(self.ids)
+        self.ids.append(product_id)
+        self.names.append(sys.intern(name))
+        self.prices.append(price)
+        self.quantities.append(quantity)
+        self.rows[product_id] = row
+        return row
+
+    def delete(self, row):
+        del self.rows[self.ids[row]]
+        self.ids[row] = None
+
+    def restore(self, row, product_id):
+        self.ids[row] = product_id
+        self.rows[product_id] = row
+
+    def iter_rows(self):
+        for product_id, name, price, quantity in zip(self.ids, self.names,
+                                                     self.prices, self.quantities):
+            if product_id is not None:
+                yield product_id, name, price, quantity
+
+class ProductListing:
+    """An ordered selection of catalog rows, read a page at a time.
+
+    Rows are fixed when the listing is made; names, prices and stock are
+    read when a page is, so a page shows the current values.
+    """
+
+    def __init__(self, catalog, rows):
+        self.catalog = catalog
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def page_count(self, page_size):
+        return max(1, -(-len(self.rows) // page_size))
+
+    def page(self, number, page_size):
+        """Products on page ``number`` (from 0); deleted ones are skipped."""
+        catalog = self.catalog
+        ids = catalog.ids
+        start = number * page_size
+        return [ProductView(catalog, row) for row in self.rows[start:start + page_size]
+                if ids[row] is not None]
+
+def name_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
 class InventoryManager:
-    def __init__(self, filename='inventory.csv'):
+    def __init__(self, filename='inventory.csv', journal=False,
+                 journal_max_entries=1000, journal_max_age=300, storage=None):
         self.filename = filename
-        self.products = []
+        if storage is None:
+            storage = CSVStorage(filename, journal, journal_max_entries, journal_max_age)
+        self.storage = storage
+        self.reset_catalog()
+        # Batch state: ids touched since the outermost batch() began, and the
+        # in-memory undo records needed to roll the batch back.
+        self.batch_depth = 0
+        self.pending_changes = {}
+        self.undo_log = []
+        self.change_listeners = []
         self.load_inventory()
 
+    def reset_catalog(self):
+        self.products = ProductCatalog()
+        # Name search index: trigram -> rows, plus each row's lowercased
+        # name. Built on the first name search so loading stays cheap. Rows
+        # are never removed from postings; the final substring check on the
+        # live name filters out deleted and renamed products.
+        self.name_index = None
+        self.name_keys = []
+        # Stock index: quantity -> rows, plus the sorted distinct quantities
+        # so threshold queries can bisect instead of scanning.
+        self.stock_buckets = {}
+        self.stock_levels = []
+
+    @timed('inventory.load_inventory')
     def load_inventory(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, mode='r') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    self.products.append(Product(
-                        row['product_id'],
-                        row['name'],
-                        float(row['price']),
-                        int(row['quantity'])
-                    ))
+        with self.storage.transaction():
+            if self.products.ids:
+                self.load_snapshot(self.storage.iter_snapshot())
+            else:
+                columns = self.storage.load_cached_snapshot()
+                if columns is not None:
+                    self.load_columns(*columns)
+                else:
+                    self.load_snapshot(self.storage.iter_snapshot())
+                    self.storage.cache_snapshot(self.products)
+            self.apply_changes(self.storage.iter_changes())
+
+    def apply_changes(self, changes):
+        for op, product_id, name, price, quantity in changes:
+            if op == InventoryJournal.DELETE:
+                row = self.products.rows.get(product_id)
+                if row is not None:
+                    self.unregister_row(row)
+            else:
+                self.upsert_row(product_id, name, price, quantity)
+
+    @timed('inventory.refresh')
+    def refresh(self):
+        """Pick up changes other processes have committed to the same store.
+
+        Call with the storage transaction held; batch() does this itself.
+        Cart entries keep working across a full reload because OrderManager
+        re-resolves them by product id at checkout.
+        """
+        reload, changes = self.storage.poll_changes()
+        if reload:
+            self.reset_catalog()
+            self.load_inventory()
+            self.notify_changes(None)
+        else:
+            self.apply_changes(changes)
+            if changes:
+                self.notify_changes([change[1] for change in changes])
+
+    def add_change_listener(self, callback):
+        """Call ``callback(product_ids)`` after products change, whether here
+        (once the batch is written) or in another process (once picked up).
+        ``product_ids`` is None after a full reload."""
+        self.change_listeners.append(callback)
+
+    def notify_changes(self, product_ids):
+        for callback in self.change_listeners:
+            callback(product_ids)
+
+    def load_snapshot(self, rows):
+        if self.products.ids:
+            for product_id, name, price, quantity in rows:
+                self.upsert_row(product_id, name, price, quantity)
+            return
 
+        # Fast path for the usual case of loading into an empty catalog:
+        # fill the columns directly, then build the indexes in bulk.
+        ids, names, prices, quantities = [], [], array('d'), array('q')
+        intern = sys.intern
+        add_id, add_name = ids.append, names.append
+        add_price, add_quantity = prices.append, quantities.append
+        for product_id, name, price, quantity in rows:
+            add_id(product_id)
+            add_name(intern(name))
+            add_price(price)
+            add_quantity(quantity)
+        self.load_columns(ids, names, prices, quantities)
+
+    def load_columns(self, ids, names, prices, quantities):
+        """Take over ready-made columns as the (empty) catalog's contents."""
+        catalog = self.products
+        catalog.ids, catalog.names = ids, names
+        catalog.prices, catalog.quantities = prices, quantities
+        catalog.rows = dict(zip(catalog.ids, range(len(catalog.ids))))
+        if len(catalog.rows) != len(catalog.ids):
+            # Duplicate ids in the file: keep the last row for each id, as
+            # replaying them one by one would.
+            for row, product_id in enumerate(catalog.ids):
+                if catalog.rows[product_id] != row:
+                    catalog.ids[row] = None
+
+        buckets = defaultdict(set)
+        for row, (product_id, quantity) in enumerate(zip(catalog.ids, catalog.quantities)):
+            if product_id is not None:
+                buckets[quantity].add(row)
+        self.stock_buckets = dict(buckets)
+        self.stock_levels = sorted(buckets)
+        if self.name_index is not None:
+            self.build_name_index()
+
+    def upsert_row(self, product_id, name, price, quantity):
+        row = self.products.rows.get(product_id)
+        if row is None:
+            return self.register_row(product_id, name, price, quantity)
+        self.set_product_fields(row, name, price, quantity)
+        return row
+
+    def register_row(self, product_id, name, price, quantity):
+        row = self.products.append(product_id, name, price, quantity)
+        self.index_name(row)
+        self.index_stock(row, quantity)
+        return row
+
+    def unregister_row(self, row):
+        self.unindex_stock(row, self.products.quantities[row])
+        self.products.delete(row)
+
+    def set_product_fields(self, row, name=None, price=None, quantity=None):
+        catalog = self.products
+        if name is not None and name != catalog.names[row]:
+            catalog.names[row] = sys.intern(name)
+            self.index_name(row)
+        if price is not None:
+            catalog.prices[row] = price
+        if quantity is not None and quantity != catalog.quantities[row]:
+            self.unindex_stock(row, catalog.quantities[row])
+            catalog.quantities[row] = quantity
+            self.index_stock(row, quantity)
+
+    def index_stock(self, row, quantity):
+        bucket = self.stock_buckets.get(quantity)
+        if bucket is None:
+            bucket = self.stock_buckets[quantity] = set()
+            bisect.insort(self.stock_levels, quantity)
+        bucket.add(row)
+
+    def unindex_stock(self, row, quantity):
+        bucket = self.stock_buckets[quantity]
+        bucket.discard(row)
+        if not bucket:
+            del self.stock_buckets[quantity]
+            del self.stock_levels[bisect.bisect_left(self.stock_levels, quantity)]
+
+    def build_name_index(self):
+        index = defaultdict(lambda: array('I'))
+        keys = []
+        add_key = keys.append
+        for row, name in enumerate(self.products.names):
+            key = name.lower()
+            if key == name:
+                key = name
+            add_key(key)
+            for gram in {key[i:i + 3] for i in range(len(key) - 2)}:
+                index[gram].append(row)
+        self.name_index = index
+        self.name_keys = keys
+
+    def index_name(self, row):
+        if self.name_index is None:
+            return
+        name = self.products.names[row]
+        key = name.lower()
+        if key == name:
+            key = name
+        if row == len(self.name_keys):
+            old_grams = ()
+            self.name_keys.append(key)
+        else:
+            old_grams = name_trigrams(self.name_keys[row])
+            self.name_keys[row] = key
+        for gram in name_trigrams(key):
+            if gram not in old_grams:
+                self.name_index[gram].append(row)
+
+    @timed('inventory.save_inventory')
     def save_inventory(self):
-        with open(self.filename, mode='w', newline='') as file:
-            fieldnames = ['product_id', 'name', 'price', 'quantity']
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            for product in self.products:
-                writer.writerow({
-                    'product_id': product.product_id,
-                    'name': product.name,
-                    'price': product.price,
-                    'quantity': product.quantity
-                })
+        with self.storage.transaction():
+            self.refresh()
+            self.storage.save_snapshot(self.products)
+
+    @contextmanager
+    def batch(self):
+        """Group catalog changes into one persisted write.
 
+        The outermost batch holds the storage transaction (the inter-process
+        lock for CSV files), first applies changes committed elsewhere, and
+        writes everything once on exit. If an exception escapes, or the
+        write fails, the in-memory catalog is rolled back.
+        """
+        if self.batch_depth:
+            with self.batch_scope():
+                yield self
+            return
+
+        with self.storage.transaction():
+            self.refresh()
+            with self.batch_scope():
+                yield self
+            product_ids = list(self.pending_changes)
+            self.pending_changes.clear()
+            try:
+                if product_ids:
+                    self.storage.write_changes(
+                        [(product_id, self.products.get(product_id))
+                         for product_id in product_ids], self.products)
+            except BaseException:
+                self.rollback(0)
+                raise
+            finally:
+                self.undo_log.clear()
+            if product_ids:
+                self.notify_changes(product_ids)
+
+    @contextmanager
+    def batch_scope(self):
+        undo_mark = len(self.undo_log)
+        self.batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self.rollback(undo_mark)
+            if self.batch_depth == 1:
+                self.pending_changes.clear()
+            raise
+        finally:
+            self.batch_depth -= 1
+
+    def rollback(self, undo_mark):
+        while len(self.undo_log) > undo_mark:
+            action, row, state = self.undo_log.pop()
+            if action == 'add':
+                self.unregister_row(row)
+            elif action == 'delete':
+                self.products.restore(row, state)
+                self.index_stock(row, self.products.quantities[row])
+            else:
+                self.set_product_fields(row, *state)
+
+    @timed('inventory.import_products')
+    def import_products(self, rows):
+        """Upsert products from an iterable of row dicts or a CSV filename.
+
+        Rows are consumed one at a time inside a single batch, so the whole
+        import is persisted once and rolled back if any row is invalid.
+        Returns ``(added, updated)`` counts.
+        """
+        if isinstance(rows, str):
+            with open(rows, mode='r', newline='') as file:
+                return self.import_products(csv.DictReader(file))
+
+        added = updated = 0
+        with self.batch():
+            for row in rows:
+                product_id = row['product_id']
+                name = row.get('name') or None
+                price = float(row['price']) if row.get('price') else None
+                quantity = int(row['quantity']) if row.get('quantity') else None
+                if product_id in self.products.rows:
+                    self.update_product(product_id, name, price, quantity)
+                    updated += 1
+                elif self.add_product(product_id, name or '', price or 0.0,
+                                      quantity or 0):
+                    added += 1
+        return added, updated
+
+    @timed('inventory.compact')
+    def compact(self):
+        with self.storage.transaction():
+            self.refresh()
+            self.storage.compact(self.products)
+
+    def get_product(self, product_id):
+        return self.products.get(product_id)
+
+    @timed('inventory.add_product')
     def add_product(self, product_id, name, price, quantity):
-        if not any(p.product_id == product_id for p in self.products):
-            self.products.append(Product(product_id, name, price, quantity))
-            self.save_inventory()
-            return True
-        return False
+        with self.batch():
+            if product_id in self.products.rows:
+                return False
+            row = self.register_row(product_id, name, price, quantity)
+            self.undo_log.append(('add', row, None))
+            self.pending_changes[product_id] = True
+        return True
 
+    @timed('inventory.update_product')
     def update_product(self, product_id, name=None, price=None, quantity=None):
-        for product in self.products:
-            if product.product_id == product_id:
-                if name is not None:
-                    product.name = name
-                if price is not None:
-                    product.price = price
-                if quantity is not None:
-                    product.quantity = quantity
-                self.save_inventory()
-                return True
-        return False
+        with self.batch():
+            row = self.products.rows.get(product_id)
+            if row is None:
+                return False
+            catalog = self.products
+            self.undo_log.append(('update', row, (catalog.names[row], catalog.prices[row],
+                                                  catalog.quantities[row])))
+            self.set_product_fields(row, name, price, quantity)
+            self.pending_changes[product_id] = True
+        return True
 
+    @timed('inventory.delete_product')
     def delete_product(self, product_id):
-        for i, product in enumerate(self.products):
-            if product.product_id == product_id:
-                del self.products[i]
-                self.save_inventory()
-                return True
-        return False
+        with self.batch():
+            row = self.products.rows.get(product_id)
+            if row is None:
+                return False
+            self.unregister_row(row)
+            self.undo_log.append(('delete', row, product_id))
+            self.pending_changes[product_id] = True
+        return True
+
+    @timed('inventory.search_product')
+    def search_product(self, product_id=None, name=None, limit=None):
+        catalog = self.products
+        id_row = catalog.rows.get(product_id) if product_id else None
+        if not name:
+            return [] if id_row is None else [ProductView(catalog, id_row)]
 
-    def search_product(self, product_id=None, name=None):
-        results = []
-        for product in self.products:
-            if (product_id and product.product_id == product_id) or \
-               (name and name.lower() in product.name.lower()):
-                results.append(product)
-        return results
+        if self.name_index is None:
+            self.build_name_index()
+        ids = catalog.ids
+        name_keys = self.name_keys
+        query = name.lower()
+        grams = sorted((self.name_index.get(gram, ()) for gram in name_trigrams(query)),
+                       key=len)
+        if not grams:
+            # Queries shorter than a trigram walk the rows in order and can
+            # stop as soon as the limit is reached.
+            matches = []
+            for row, key in enumerate(name_keys):
+                if (query in key or row == id_row) and ids[row] is not None:
+                    matches.append(row)
+                    if limit is not None and len(matches) >= limit:
+                        break
+        else:
+            candidates = set(grams[0])
+            for postings in grams[1:]:
+                candidates.intersection_update(postings)
+            if id_row is not None:
+                candidates.add(id_row)
+            matches = sorted(row for row in candidates
+                             if ids[row] is not None and
+                             (query in name_keys[row] or row == id_row))
+            if limit is not None:
+                del matches[limit:]
+        return [ProductView(catalog, row) for row in matches]
 
+    sort_keys = ('id', 'name', 'price', 'stock')
+
+    @timed('inventory.list_products')
+    def list_products(self, name=None, sort_by=None, descending=False,
+                      min_stock=None, max_stock=None):
+        """Products matching ``name`` (a substring, as in ``search_product``)
+        and the stock range, in catalog order or sorted by one of
+        ``sort_keys``, as a ``ProductListing``."""
+        catalog = self.products
+        if name:
+            rows = [product.row for product in self.search_product(name=name)]
+        else:
+            rows = [row for row, product_id in enumerate(catalog.ids) if product_id is not None]
+        if min_stock is not None or max_stock is not None:
+            quantities = catalog.quantities
+            low = min_stock if min_stock is not None else -sys.maxsize
+            high = max_stock if max_stock is not None else sys.maxsize
+            rows = [row for row in rows if low <= quantities[row] <= high]
+        if sort_by == 'id':
+            rows.sort(key=catalog.ids.__getitem__, reverse=descending)
+        elif sort_by == 'name':
+            names = catalog.names
+            rows.sort(key=lambda row: names[row].lower(), reverse=descending)
+        elif sort_by == 'price':
+            rows.sort(key=catalog.prices.__getitem__, reverse=descending)
+        elif sort_by == 'stock':
+            rows.sort(key=catalog.quantities.__getitem__, reverse=descending)
+        elif sort_by is not None:
+            raise ValueError(f"cannot sort by {sort_by!r}")
+        elif descending:
+            rows.reverse()
+        return ProductListing(catalog, rows)
+
+    @timed('inventory.get_low_stock_products')
     def get_low_stock_products(self, threshold=5):
-        return [p for p in self.products if p.quantity <= threshold]
+        levels = self.stock_levels[:bisect.bisect_right(self.stock_levels, threshold)]
+        rows = sorted(row for level in levels for row in self.stock_buckets[level])
+        return [ProductView(self.products, row) for row in rows]
 
 class OrderManager:
-    def __init__(self, inventory_manager):
+    def __init__(self, inventory_manager, storage=None, bill_writer=None, order_ids=None,
+                 velocity=None):
         self.inventory = inventory_manager
+        self.storage = storage or inventory_manager.storage
+        self.bill_writer = bill_writer
+        self.order_ids = order_ids or default_generator
+        self.velocity = velocity
+        # Each cart line keeps its product id as well as the product: a view
+        # of a product deleted since it was added no longer has one.
         self.cart = []
+        # Cart lines whose products were no longer sold at the last checkout.
+        self.unavailable = []
         self.sales_records = []
-        self.sales_file = 'sales_records.csv'
+        self.storage.prepare_sales((product.product_id, product.name)
+                                   for product in self.inventory.products)
+        self.low_stock_listeners = []
 
+    @timed('orders.add_to_cart')
     def add_to_cart(self, product_id, quantity):
-        product = next((p for p in self.inventory.products if p.product_id == product_id), None)
+        product = self.inventory.get_product(product_id)
         if product and product.quantity >= quantity:
             self.cart.append({
+                'product_id': product.product_id,
                 'product': product,
                 'quantity': quantity,
                 'subtotal': product.price * quantity
@@ -97,9 +575,14 @@ class OrderManager:
             return True
         return False
 
+    def add_low_stock_listener(self, callback, threshold=5):
+        """Call ``callback(products)`` when an order takes stock of any
+        product from above ``threshold`` to at or below it."""
+        self.low_stock_listeners.append((threshold, callback))
+
     def remove_from_cart(self, product_id):
         for i, item in enumerate(self.cart):
-            if item['product'].product_id == product_id:
+            if item['product_id'] == product_id:
                 del self.cart[i]
                 return True
         return False
@@ -108,37 +591,104 @@ class OrderManager:
         total = sum(item['subtotal'] for item in self.cart)
         return total * (1 - discount/100)
 
+    @timed('orders.process_order')
     def process_order(self, discount=0):
         if not self.cart:
             return False
 
-        total = self.calculate_total(discount)
-        order_time = datetime.now()
-        order_id = order_time.strftime("%Y%m%d%H%M%S")
+        # Hold the storage transaction from the stock check to the sale
+        # record, so concurrent checkout lanes cannot sell the same units.
+        with self.storage.transaction():
+            with self.inventory.batch():
+                staged = self.stage_order(discount)
+                if not staged:
+                    return False
+            self.record_staged_sales([staged])
+        return self.complete_order(*staged)
 
-        # Update inventory
-        for item in self.cart:
-            product = item['product']
-            product.quantity -= item['quantity']
-        
-        self.inventory.save_inventory()
+    @timed('orders.stage_order')
+    def stage_order(self, discount=0):
+        """Check the cart and take its stock, without recording the sale.
 
-        # Record sale
+        Call inside ``inventory.batch()``. Returns ``(sale_record,
+        stock_before)`` for ``complete_order``, or False if the cart cannot
+        be filled. Several staged orders can share one batch and be recorded
+        together with ``record_staged_sales`` once the batch has exited.
+        """
+        if not self.cart or not self.reserve_cart():
+            return False
+
+        total = self.calculate_total(discount)
+        order_time = datetime.now()
+        order_id = self.order_ids.next_id(order_time)
         sale_record = {
             'order_id': order_id,
             'datetime': order_time,
             'items': len(self.cart),
             'total': total,
-            'details': [(item['product'].name, item['quantity'], item['subtotal']) for item in self.cart]
+            'line_items': [{
+                'order_id': order_id,
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'unit_price': item['product'].price,
+                'subtotal': item['subtotal']
+            } for item in self.cart]
         }
+
+        stock_before = {}
+        for item in self.cart:
+            product = item['product']
+            stock_before.setdefault(product.product_id, (product, product.quantity))
+            self.inventory.update_product(
+                product.product_id,
+                quantity=product.quantity - item['quantity'])
+        return sale_record, stock_before
+
+    @timed('orders.complete_order')
+    def complete_order(self, sale_record, stock_before):
+        """Finish an order once its sale is recorded: update sales velocity,
+        notify low stock listeners, build the bill and clear the cart."""
         self.sales_records.append(sale_record)
-        self.save_sale_record(sale_record)
+        if self.velocity is not None:
+            self.velocity.record_sales([sale_record])
+
+        for threshold, callback in self.low_stock_listeners:
+            crossed = [product for product, before in stock_before.values()
+                       if before > threshold >= product.quantity]
+            if crossed:
+                callback(crossed)
         
         # Generate bill
-        bill = self.generate_bill(order_id, order_time, total)
+        bill = self.generate_bill(sale_record['order_id'], sale_record['datetime'],
+                                  sale_record['total'])
         self.cart.clear()
         return bill
 
+    def reserve_cart(self):
+        """Re-check every cart line against current stock, with the storage
+        transaction held and other lanes' changes applied. Lines are repriced
+        at the current price, so the bill and the recorded line items agree.
+        Lines whose products have been deleted are listed in ``unavailable``."""
+        self.unavailable = [item['product_id'] for item in self.cart
+                            if self.inventory.get_product(item['product_id']) is None]
+        if self.unavailable:
+            return False
+        needed = {}
+        for item in self.cart:
+            product = self.inventory.get_product(item['product_id'])
+            item['product'] = product
+            item['subtotal'] = product.price * item['quantity']
+            needed[product.product_id] = needed.get(product.product_id, 0) + item['quantity']
+        return all(self.inventory.get_product(product_id).quantity >= quantity
+                   for product_id, quantity in needed.items())
+
+    def order_error(self):
+        """Why the last checkout could not be filled."""
+        if self.unavailable:
+            return f"no longer sold: {', '.join(self.unavailable)}"
+        return "insufficient stock"
+
+    @timed('orders.generate_bill')
     def generate_bill(self, order_id, order_time, total):
         bill_lines = [
             "=== INVOICE ===",
@@ -164,37 +714,90 @@ class OrderManager:
         
         return "\n".join(bill_lines)
 
+    @timed('orders.save_sale_record')
     def save_sale_record(self, sale_record):
-        file_exists = os.path.exists(self.sales_file)
-        with open(self.sales_file, mode='a', newline='') as file:
-            fieldnames = ['order_id', 'datetime', 'items', 'total', 'details']
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(sale_record)
+        self.storage.record_sale(sale_record)
 
+    @timed('orders.record_staged_sales')
+    def record_staged_sales(self, staged):
+        """Record the sales of ``(sale_record, stock_before)`` pairs from
+        ``stage_order``.
+
+        Call with the storage transaction held, after the inventory batch
+        that took the stock has exited: the stock change is saved first, so
+        a failed catalog write can never leave a recorded sale behind. If
+        recording the sales fails, the stock is put back and the error
+        re-raised.
+        """
+        try:
+            self.storage.record_sales([sale_record for sale_record, _ in staged])
+        except BaseException:
+            # Latest order first, so each product ends at its stock from
+            # before the first order.
+            with self.inventory.batch():
+                for _, stock_before in reversed(staged):
+                    for product_id, (_, quantity) in stock_before.items():
+                        self.inventory.update_product(product_id, quantity=quantity)
+            raise
+
+    @timed('orders.get_daily_sales')
     def get_daily_sales(self, date=None):
         if not date:
             date = datetime.now().date()
-        
-        daily_sales = [s for s in self.sales_records 
-                      if datetime.strptime(s['datetime'], '%Y-%m-%d %H:%M:%S').date() == date]
-        
-        total_sales = sum(s['total'] for s in daily_sales)
-        total_items = sum(s['items'] for s in daily_sales)
-        
-        return {
-            'date': date,
-            'total_sales': total_sales,
-            'total_items': total_items,
-            'num_orders': len(daily_sales)
-        }
+        return self.storage.get_day_totals(date)
+
+    @timed('orders.get_sales_range')
+    def get_sales_range(self, start_date, end_date):
+        return self.storage.get_range_totals(start_date, end_date)
+
+    def iter_sales(self, start=None, end=None):
+        return self.storage.iter_sales(start, end)
+
+    @timed('orders.reconcile_sales')
+    def reconcile_sales(self, start_date, end_date=None):
+        """Recount ``start_date`` through ``end_date`` (default: just
+        ``start_date``) from the sales history in one pass and compare each
+        day with the stored totals. Returns ``{'stored': ..., 'recounted':
+        ...}`` for every day that differs, oldest first."""
+        end_date = end_date or start_date
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.max.time())
+        recounted = {}
+        for sale in self.iter_sales(start, end):
+            day = recounted.setdefault(sale['datetime'].date(), [0, 0, 0.0])
+            day[0] += 1
+            day[1] += sale['items']
+            day[2] += sale['total']
+        mismatches = []
+        for stored in self.storage.get_range_totals(start_date, end_date):
+            num_orders, total_items, total_sales = recounted.get(stored['date'], (0, 0, 0.0))
+            if (stored['num_orders'] != num_orders or stored['total_items'] != total_items or
+                    abs(stored['total_sales'] - total_sales) >= 0.005):
+                mismatches.append({'stored': stored, 'recounted': {
+                    'date': stored['date'], 'total_sales': total_sales,
+                    'total_items': total_items, 'num_orders': num_orders}})
+        return mismatches
+
+    @timed('orders.save_bill_to_file')
+    def save_bill_to_file(self, bill_content, filename=None, filetype='txt', sale_record=None):
+        """Save a bill as txt, csv or pdf.
+
+        With a ``bill_writer`` and no explicit filename the write is queued
+        and the path under ``bills/`` is returned straight away; pass the
+        order's ``sale_record`` to name the file after it.
+        """
+        if sale_record is not None:
+            order_id, order_time = sale_record['order_id'], sale_record['datetime']
+        else:
+            order_time = datetime.now()
+            order_id = self.order_ids.next_id(order_time)
+
+        if not filename and self.bill_writer is not None:
+            return self.bill_writer.submit(bill_content, order_id, order_time, filetype)
 
-    def save_bill_to_file(self, bill_content, filename=None, filetype='txt'):
         if not filename:
-            filename = f"bill_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{filetype}"
+            filename = f"bill_{order_id}.{filetype}"
         
-        with open(filename, 'w') as file:
-            file.write(bill_content)
+        write_bill(filename, bill_content, filetype)
         
         return filename
\ No newline at end of file
@@ -1,11 +1,24 @@
+from bill_writer import BillWriter
 from inventory_backend import InventoryManager, OrderManager
+from metrics import metrics
+from report_cache import ReportCache
+from sales_velocity import SalesVelocity
 import datetime
-from fpdf import FPDF
 
 class InventoryApp:
-    def __init__(self):
-        self.inventory_manager = InventoryManager()
-        self.order_manager = OrderManager(self.inventory_manager)
+    page_size = 20
+
+    def __init__(self, storage=None, page_size=None):
+        if page_size:
+            self.page_size = page_size
+        self.inventory_manager = InventoryManager(journal=True, storage=storage)
+        self.bill_writer = BillWriter()
+        self.velocity = SalesVelocity(self.inventory_manager)
+        self.order_manager = OrderManager(self.inventory_manager, bill_writer=self.bill_writer,
+                                          velocity=self.velocity)
+        self.order_manager.add_low_stock_listener(self.low_stock_alert)
+        self.report_cache = ReportCache(self.inventory_manager)
+        self.sales_analytics = None
         self.run()
 
     def display_menu(self):
@@ -73,15 +86,30 @@ class InventoryApp:
             print("\n--- REPORTS ---")
             print("1. Daily Sales Report")
             print("2. Low Stock Report")
-            print("3. Back to Main Menu")
+            print("3. Reorder Suggestions")
+            print("4. Sales Range Report")
+            print("5. Product Sales Report")
+            print("6. Hourly Sales Heatmap")
+            print("7. Performance Metrics")
+            print("8. Back to Main Menu")
             
-            choice = input("Enter your choice (1-3): ")
+            choice = input("Enter your choice (1-8): ")
             
             if choice == '1':
                 self.daily_sales_report()
             elif choice == '2':
                 self.low_stock_report()
             elif choice == '3':
+                self.reorder_report()
+            elif choice == '4':
+                self.sales_range_report()
+            elif choice == '5':
+                self.product_sales_report()
+            elif choice == '6':
+                self.hourly_sales_report()
+            elif choice == '7':
+                self.metrics_report()
+            elif choice == '8':
                 break
             else:
                 print("Invalid choice. Please try again.")
@@ -154,41 +182,117 @@ class InventoryApp:
         if choice == '1':
             product_id = input("Enter Product ID: ")
             results = self.inventory_manager.search_product(product_id=product_id)
+            if not results:
+                print("No products found.")
+            else:
+                print("\n".join(["\nSearch Results:"] + self.format_products(results)))
         elif choice == '2':
             name = input("Enter Product Name (or part of name): ")
-            results = self.inventory_manager.search_product(name=name)
+            self.browse_products("SEARCH RESULTS", name=name)
         else:
             print("Invalid choice.")
-            return
-        
-        if not results:
-            print("No products found.")
-        else:
-            print("\nSearch Results:")
-            print("ID\tName\t\tPrice\tStock")
-            print("----------------------------------------")
-            for product in results:
-                print(f"{product.product_id}\t{product.name[:15]}\t{product.price:.2f}\t{product.quantity}")
+
+    def format_products(self, products, numbered=False):
+        lines = ["#\tID\tName\t\tPrice\tStock" if numbered else "ID\tName\t\tPrice\tStock",
+                 "----------------------------------------"]
+        for number, product in enumerate(products, 1):
+            line = f"{product.product_id}\t{product.name[:15]}\t{product.price:.2f}\t{product.quantity}"
+            lines.append(f"{number}\t{line}" if numbered else line)
+        return lines
 
     def view_all_products(self):
-        products = self.inventory_manager.products
-        if not products:
+        if not self.inventory_manager.products:
             print("No products in inventory.")
             return
-        
-        print("\n--- ALL PRODUCTS ---")
-        print("ID\tName\t\tPrice\tStock")
-        print("----------------------------------------")
-        for product in products:
-            print(f"{product.product_id}\t{product.name[:15]}\t{product.price:.2f}\t{product.quantity}")
+        self.browse_products("ALL PRODUCTS")
+
+    def browse_products(self, title, name=None):
+        """Page through products, with commands to sort and filter. Each
+        page is printed in one write."""
+        sort_by, descending, in_stock = None, False, False
+        listing = self.inventory_manager.list_products(name=name)
+        page = 0
+        while True:
+            if not listing and not name and not in_stock:
+                print("No products found.")
+                return
+            pages = listing.page_count(self.page_size)
+            page = max(0, min(page, pages - 1))
+            order = f"{'-' if descending else ''}{sort_by}" if sort_by else "catalog order"
+            shown = ', '.join(filter(None, [f"name contains {name!r}" if name else '',
+                                            "in stock only" if in_stock else '']))
+            lines = [f"\n--- {title} ---"]
+            lines.extend(self.format_products(listing.page(page, self.page_size)) if listing
+                         else ["No products found."])
+            lines.append("----------------------------------------")
+            lines.append(f"Page {page + 1} of {pages} ({len(listing)} products, {order}"
+                         f"{', ' + shown if shown else ''})")
+            lines.append("Enter: next page  p: previous  <number>: go to page  "
+                         "s <id|name|price|stock>: sort (-price for descending)  "
+                         "f <text>: filter by name  i: in stock only on/off  q: back")
+            print("\n".join(lines))
+
+            command = input("> ").strip()
+            if command == '':
+                if page + 1 >= pages:
+                    return
+                page += 1
+                continue
+            if command.lower() == 'q':
+                return
+            if command.lower() == 'p':
+                page -= 1
+                continue
+            if command.isdigit():
+                page = int(command) - 1
+                continue
+            action, _, argument = command.partition(' ')
+            action, argument = action.lower(), argument.strip()
+            if action == 's':
+                field = argument.lower().lstrip('-')
+                if field not in self.inventory_manager.sort_keys:
+                    print("Sort by id, name, price or stock.")
+                    continue
+                sort_by, descending = field, argument.startswith('-')
+            elif action == 'f':
+                name = argument or None
+            elif action == 'i':
+                in_stock = not in_stock
+            else:
+                print("Invalid command.")
+                continue
+            listing = self.inventory_manager.list_products(
+                name=name, sort_by=sort_by, descending=descending,
+                min_stock=1 if in_stock else None)
+            page = 0
 
     def add_to_cart(self):
         print("\n--- ADD TO CART ---")
-        self.view_all_products()
-        product_id = input("Enter Product ID to add to cart: ")
+        query = input("Enter Product ID or name to look up: ").strip()
+        product = self.inventory_manager.get_product(query)
+        if product is None and query:
+            # Ask for one extra match so we know whether the list was cut off.
+            matches = self.inventory_manager.search_product(name=query, limit=self.page_size + 1)
+            if not matches:
+                print("No products found.")
+                return
+            lines = self.format_products(matches[:self.page_size], numbered=True)
+            if len(matches) > self.page_size:
+                lines.append(f"Showing the first {self.page_size} matches. "
+                             f"Refine your search to see more.")
+            print("\n".join(lines))
+            choice = input("Enter # or Product ID: ").strip()
+            product = self.inventory_manager.get_product(choice)
+            shown = min(len(matches), self.page_size)
+            if product is None and choice.isdigit() and 1 <= int(choice) <= shown:
+                product = matches[int(choice) - 1]
+        if product is None:
+            print("Error: Product not found.")
+            return
+        print(f"{product.name} ({product.product_id}): {product.price:.2f}, {product.quantity} in stock")
         quantity = int(input("Enter Quantity: "))
         
-        if self.order_manager.add_to_cart(product_id, quantity):
+        if self.order_manager.add_to_cart(product.product_id, quantity):
             print("Item added to cart successfully!")
         else:
             print("Error: Product not found or insufficient stock.")
@@ -246,18 +350,27 @@ class InventoryApp:
         confirm = input("Confirm purchase? (y/n): ").lower()
         if confirm == 'y':
             bill = self.order_manager.process_order(discount)
+            if not bill:
+                print(f"Order could not be processed: {self.order_manager.order_error()}.")
+                return
             print("\n" + bill)
             
             save_bill = input("Save bill to file? (y/n): ").lower()
             if save_bill == 'y':
-                filetype = input("Save as (txt/csv): ").lower()
-                if filetype not in ['txt', 'csv']:
+                filetype = input("Save as (txt/csv/pdf): ").lower()
+                if filetype not in ['txt', 'csv', 'pdf']:
                     print("Invalid file type. Defaulting to txt.")
                     filetype = 'txt'
                 
-                filename = self.order_manager.save_bill_to_file(bill, filetype=filetype)
+                filename = self.order_manager.save_bill_to_file(
+                    bill, filetype=filetype, sale_record=self.order_manager.sales_records[-1])
                 print(f"Bill saved as {filename}")
 
+    def low_stock_alert(self, products):
+        print("\nLow stock alert - consider reordering:")
+        for product in products:
+            print(f"  {product.product_id}\t{product.name[:15]}\t{product.quantity} left")
+
     def daily_sales_report(self):
         date_str = input("Enter date for report (YYYY-MM-DD) or leave blank for today: ")
         
@@ -270,21 +383,22 @@ class InventoryApp:
             print("Invalid date format. Please use YYYY-MM-DD.")
             return
         
-        report = self.order_manager.get_daily_sales(date)
+        report = self.report_cache.daily_sales(date)
         
         print(f"\n--- DAILY SALES REPORT FOR {date} ---")
         print(f"Total Orders: {report['num_orders']}")
         print(f"Total Items Sold: {report['total_items']}")
         print(f"Total Sales Amount: {report['total_sales']:.2f}")
+        self.print_mismatches(self.report_cache.reconcile_sales(self.order_manager, date))
 
         # Automatically save as CSV
-        import csv
         csv_filename = f"daily_sales_report_{date}.csv"
-        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Date", "Total Orders", "Total Items Sold", "Total Sales Amount"])
-            writer.writerow([date, report['num_orders'], report['total_items'], f"{report['total_sales']:.2f}"])
-        print(f"CSV saved as {csv_filename}")
+        if self.report_cache.export_csv(
+                csv_filename, ["Date", "Total Orders", "Total Items Sold", "Total Sales Amount"],
+                [[date, report['num_orders'], report['total_items'], f"{report['total_sales']:.2f}"]]):
+            print(f"CSV saved as {csv_filename}")
+        else:
+            print(f"CSV {csv_filename} is up to date")
 
         # PDF download option removed
 
@@ -297,29 +411,226 @@ class InventoryApp:
             print("Invalid threshold. Using default value 5.")
             threshold = 5
         
-        low_stock = self.inventory_manager.get_low_stock_products(threshold)
+        low_stock = self.report_cache.low_stock(threshold)
         
         if not low_stock:
             print(f"\nNo products with stock below {threshold}.")
             return
         
-        print(f"\n--- LOW STOCK REPORT (Below {threshold}) ---")
-        print("ID\tName\t\tStock")
+        lines = [f"\n--- LOW STOCK REPORT (Below {threshold}) ---",
+                 "ID\tName\t\tStock",
+                 "----------------------------------------"]
+        for product_id, name, quantity in low_stock:
+            lines.append(f"{product_id}\t{name[:15]}\t{quantity}")
+        print("\n".join(lines))
+
+        # Automatically save as CSV
+        csv_filename = f"low_stock_report_{datetime.date.today()}.csv"
+        if self.report_cache.export_csv(csv_filename, ["Product ID", "Name", "Stock"], low_stock):
+            print(f"CSV saved as {csv_filename}")
+        else:
+            print(f"CSV {csv_filename} is up to date")
+
+        # PDF download option removed
+
+    def reorder_report(self):
+        limit = input("Number of products to show (default 10): ") or "10"
+        days = input("Days of stock to reorder for (default 14): ") or "14"
+        
+        try:
+            limit = int(limit)
+            days = int(days)
+        except ValueError:
+            print("Invalid number. Using defaults (10 products, 14 days).")
+            limit, days = 10, 14
+        
+        suggestions = self.velocity.reorder_suggestions(limit)
+        
+        if not suggestions:
+            print("\nNo sales recorded yet, so no reorder suggestions.")
+            return
+        
+        today = datetime.date.today()
+        rows = []
+        print("\n--- REORDER SUGGESTIONS (soonest stock-out first) ---")
+        print("ID\tName\t\tStock\tPer Day\tCover\tStock-out\tReorder")
+        print("------------------------------------------------------------------------")
+        for product, rate, cover in suggestions:
+            stock_out = today + datetime.timedelta(days=min(cover, 36500))
+            reorder = max(0, round(rate * days - product.quantity))
+            rows.append([product.product_id, product.name, product.quantity, f"{rate:.2f}",
+                         f"{cover:.1f}", stock_out, reorder])
+            print(f"{product.product_id}\t{product.name[:15]}\t{product.quantity}\t{rate:.2f}\t"
+                  f"{cover:.1f}d\t{stock_out}\t{reorder}")
+
+        # Automatically save as CSV
+        import csv
+        csv_filename = f"reorder_report_{today}.csv"
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Product ID", "Name", "Stock", "Units Per Day", "Days of Cover",
+                             "Projected Stock-out", f"Reorder Qty ({days} days)"])
+            writer.writerows(rows)
+        print(f"CSV saved as {csv_filename}")
+
+    def print_mismatches(self, mismatches):
+        # Stored totals that disagree with the sales history, e.g. after a
+        # crash between the two writes.
+        for mismatch in mismatches:
+            stored, recounted = mismatch['stored'], mismatch['recounted']
+            print(f"Warning: stored totals for {stored['date']} ({stored['num_orders']} orders, "
+                  f"{stored['total_sales']:.2f}) differ from the sales history "
+                  f"({recounted['num_orders']} orders, {recounted['total_sales']:.2f})")
+
+    def get_sales_analytics(self):
+        # NumPy is optional and slow to import, so it is loaded on first use.
+        if self.sales_analytics is None:
+            try:
+                from sales_analytics import SalesAnalytics
+                storage = self.inventory_manager.storage
+                self.sales_analytics = SalesAnalytics(storage, storage.analytics_cache)
+            except ImportError as e:
+                print(f"\n{e}")
+                return None
+        self.sales_analytics.refresh()
+        return self.sales_analytics
+
+    def read_date_range(self):
+        today = datetime.date.today()
+        start_str = input("Enter start date (YYYY-MM-DD) or leave blank for 30 days ago: ")
+        end_str = input("Enter end date (YYYY-MM-DD) or leave blank for today: ")
+        
+        try:
+            if start_str:
+                start_date = datetime.datetime.strptime(start_str, "%Y-%m-%d").date()
+            else:
+                start_date = today - datetime.timedelta(days=29)
+            if end_str:
+                end_date = datetime.datetime.strptime(end_str, "%Y-%m-%d").date()
+            else:
+                end_date = today
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            return None
+        
+        if end_date < start_date:
+            print("End date is before start date.")
+            return None
+        return start_date, end_date
+
+    def sales_range_report(self):
+        dates = self.read_date_range()
+        analytics = dates and self.get_sales_analytics()
+        if not analytics:
+            return
+        start_date, end_date = dates
+        
+        summary = analytics.range_summary(start_date, end_date)
+        days = analytics.daily_breakdown(start_date, end_date)
+        
+        print(f"\n--- SALES REPORT {start_date} TO {end_date} ---")
+        print(f"Total Orders: {summary['num_orders']}")
+        print(f"Total Items Sold: {summary['total_items']}")
+        print(f"Total Sales Amount: {summary['total_sales']:.2f}")
+        print(f"Distinct Products Sold: {summary['products_sold']}")
+        print("\nDate\t\tOrders\tItems\tSales")
         print("----------------------------------------")
-        for product in low_stock:
-            print(f"{product.product_id}\t{product.name[:15]}\t{product.quantity}")
+        for day in days:
+            if day['num_orders']:
+                print(f"{day['date']}\t{day['num_orders']}\t{day['total_items']}\t{day['total_sales']:.2f}")
+        self.print_mismatches(self.order_manager.reconcile_sales(start_date, end_date))
 
         # Automatically save as CSV
         import csv
-        csv_filename = f"low_stock_report_{datetime.date.today()}.csv"
+        csv_filename = f"sales_range_report_{start_date}_{end_date}.csv"
         with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(["Product ID", "Name", "Stock"])
-            for product in low_stock:
-                writer.writerow([product.product_id, product.name, product.quantity])
+            writer.writerow(["Date", "Total Orders", "Total Items Sold", "Total Sales Amount"])
+            for day in days:
+                writer.writerow([day['date'], day['num_orders'], day['total_items'], f"{day['total_sales']:.2f}"])
+            writer.writerow(["Total", summary['num_orders'], summary['total_items'], f"{summary['total_sales']:.2f}"])
         print(f"CSV saved as {csv_filename}")
 
-        # PDF download option removed
+    def product_sales_report(self):
+        dates = self.read_date_range()
+        if not dates:
+            return
+        limit = input("Show top N products (default 10, 0 for all): ") or "10"
+        by = input("Rank by (revenue/units, default revenue): ").lower() or "revenue"
+        
+        try:
+            limit = int(limit)
+        except ValueError:
+            print("Invalid number. Using default value 10.")
+            limit = 10
+        if by not in ['revenue', 'units']:
+            print("Invalid ranking. Ranking by revenue.")
+            by = 'revenue'
+        
+        analytics = self.get_sales_analytics()
+        if not analytics:
+            return
+        start_date, end_date = dates
+        products = analytics.product_breakdown(start_date, end_date, limit or None,
+                                               'units' if by == 'units' else 'total_sales')
+        
+        if not products:
+            print(f"\nNo sales between {start_date} and {end_date}.")
+            return
+        
+        print(f"\n--- PRODUCT SALES {start_date} TO {end_date} (by {by}) ---")
+        print("ID\tName\t\tUnits\tSales")
+        print("----------------------------------------")
+        rows = []
+        for product_id, units, total_sales in products:
+            product = self.inventory_manager.get_product(product_id)
+            name = product.name if product else ''
+            rows.append([product_id, name, units, f"{total_sales:.2f}"])
+            print(f"{product_id}\t{name[:15]}\t{units}\t{total_sales:.2f}")
+
+        # Automatically save as CSV
+        import csv
+        csv_filename = f"product_sales_report_{start_date}_{end_date}.csv"
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Product ID", "Name", "Units Sold", "Total Sales Amount"])
+            writer.writerows(rows)
+        print(f"CSV saved as {csv_filename}")
+
+    def hourly_sales_report(self):
+        dates = self.read_date_range()
+        analytics = dates and self.get_sales_analytics()
+        if not analytics:
+            return
+        start_date, end_date = dates
+        
+        num_orders, total_sales = analytics.hourly_heatmap(start_date, end_date)
+        weekdays = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        
+        print(f"\n--- ORDERS BY WEEKDAY AND HOUR {start_date} TO {end_date} ---")
+        print("     " + "".join(f"{hour:>5}" for hour in range(24)))
+        for weekday, counts in zip(weekdays, num_orders):
+            print(f"{weekday:<5}" + "".join(f"{count:>5}" for count in counts))
+
+        # Automatically save as CSV
+        import csv
+        csv_filename = f"hourly_sales_report_{start_date}_{end_date}.csv"
+        with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Weekday", "Hour", "Total Orders", "Total Sales Amount"])
+            for weekday, counts, sales in zip(weekdays, num_orders, total_sales):
+                for hour in range(24):
+                    writer.writerow([weekday, hour, int(counts[hour]), f"{sales[hour]:.2f}"])
+        print(f"CSV saved as {csv_filename}")
+
+    def metrics_report(self):
+        if not metrics.enabled:
+            print("\nMetrics are off. Start with --metrics (or --metrics-file FILE) to collect them.")
+            return
+
+        print("\n--- PERFORMANCE METRICS ---")
+        for line in metrics.report_lines():
+            print(line)
 
     def run(self):
         while True:
@@ -332,6 +643,10 @@ class InventoryApp:
             elif choice == '3':
                 self.reports_menu()
             elif choice == '4':
+                self.inventory_manager.compact()
+                self.velocity.save()
+                for filename, error in self.bill_writer.close():
+                    print(f"Could not save bill {filename}: {error}")
                 print("Exiting the system. Goodbye!")
                 break
             else:
@@ -0,0 +1,843 @@
+"""
+Storage backends for InventoryManager and OrderManager
+"""
+
+from array import array
+from contextlib import contextmanager
+import csv
+from datetime import datetime, timedelta
+import hashlib
+import io
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+from metrics import metrics, timed
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from sales_history import SalesHistoryReader
+from sales_line_items import LineItemLog, convert_sales_records, has_legacy_details
+from sales_store import SalesStore
+
+class FileLock:
+    """Exclusive advisory lock on a sidecar file, shared by every process
+    that opens the same store. Re-entrant within one thread; other threads
+    of the process wait for it like other processes do."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.depth = 0
+        # flock is per open file, not per thread, so threads queue here first.
+        self.thread_lock = threading.RLock()
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                self.file = open(self.filename, mode='a+b')
+                if fcntl is not None:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self.file.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            # LK_LOCK gives up after ten one-second retries.
+                            continue
+            except BaseException:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+class InventoryJournal:
+    """Append-only log of catalog changes made since the last CSV snapshot.
+
+    Each line is ``op,product_id,name,price,quantity`` where ``op`` is
+    ``upsert`` (the full row after the change) or ``delete``. Records carry
+    absolute values, so replaying a record twice is harmless. ``offset`` is
+    how far this process has read, so changes appended by other processes
+    can be picked up by reading from there.
+    """
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+
+    def __init__(self, filename, max_entries=1000, max_age=300):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.entries = 0
+        self.offset = 0
+        self.last_compaction = time.time()
+
+    def truncate_torn_tail(self):
+        # A crash mid-append can leave a partial last line; cut it off so the
+        # next append starts on a fresh line instead of extending it.
+        with open(self.filename, mode='rb+') as file:
+            data = file.read()
+            if data and not data.endswith(b'\n'):
+                file.truncate(data.rfind(b'\n') + 1)
+
+    def replay(self):
+        self.offset = 0
+        if not os.path.exists(self.filename):
+            return []
+        self.truncate_torn_tail()
+        return self.read_new()
+
+    def read_new(self):
+        try:
+            with open(self.filename, mode='rb') as file:
+                file.seek(self.offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        rows_before = self.entries
+
+        records = []
+        for row in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+            if len(row) != 5 or row[0] not in (self.UPSERT, self.DELETE):
+                continue
+            if row[0] == self.DELETE:
+                records.append((row[0], row[1], None, None, None))
+                continue
+            try:
+                price, quantity = float(row[3]), int(row[4])
+            except ValueError:
+                continue
+            records.append((row[0], row[1], row[2], price, quantity))
+        self.entries += len(records)
+        metrics.record_io(self.filename, bytes_read=len(data), rows_read=self.entries - rows_before)
+        return records
+
+    def size(self):
+        try:
+            return os.path.getsize(self.filename)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, changes):
+        with open(self.filename, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            for product_id, product in changes:
+                if product is None:
+                    writer.writerow([self.DELETE, product_id, '', '', ''])
+                else:
+                    writer.writerow([self.UPSERT, product_id, product.name,
+                                     product.price, product.quantity])
+            file.flush()
+            os.fsync(file.fileno())
+            end = file.tell()
+        metrics.record_io(self.filename, bytes_written=end - self.offset,
+                          rows_written=len(changes))
+        self.offset = end
+        self.entries += len(changes)
+
+    def needs_compaction(self):
+        return (self.entries >= self.max_entries or
+                time.time() - self.last_compaction >= self.max_age)
+
+    def clear(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.entries = 0
+        self.offset = 0
+        self.last_compaction = time.time()
+
+class SnapshotCache:
+    """Binary copy of the parsed ``inventory.csv`` for fast startup.
+
+    Holds the catalog as columns: ids and names as NUL-separated UTF-8,
+    prices and quantities as raw ``array`` bytes. The header records the
+    CSV's size, mtime and BLAKE2b hash; the cache is only used when all
+    three still match the CSV, so an edited or replaced CSV is parsed
+    again (and the cache rebuilt).
+    """
+
+    header = struct.Struct('<8sQqQ32sQQ')
+    magic = b'INVSNAP' + (b'L' if sys.byteorder == 'little' else b'B')
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def csv_digest(self, csv_filename):
+        digest = hashlib.blake2b(digest_size=32)
+        with open(csv_filename, mode='rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.digest()
+
+    def load(self, csv_filename, csv_stat):
+        """Return ``(ids, names, prices, quantities)`` or None if the cache
+        is missing or does not match the CSV described by ``csv_stat``."""
+        try:
+            with open(self.filename, mode='rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < self.header.size:
+            return None
+        magic, size, mtime_ns, count, digest, ids_length, names_length = \
+            self.header.unpack_from(data)
+        if magic != self.magic or size != csv_stat.st_size or mtime_ns != csv_stat.st_mtime_ns:
+            return None
+        offset = self.header.size
+        prices_length = quantities_length = count * 8
+        if len(data) != offset + ids_length + names_length + prices_length + quantities_length:
+            return None
+        if digest != self.csv_digest(csv_filename):
+            return None
+
+        ids = data[offset:offset + ids_length].decode('utf-8').split('\0') if count else []
+        offset += ids_length
+        names = data[offset:offset + names_length].decode('utf-8').split('\0') if count else []
+        offset += names_length
+        prices = array('d')
+        prices.frombytes(data[offset:offset + prices_length])
+        offset += prices_length
+        quantities = array('q')
+        quantities.frombytes(data[offset:offset + quantities_length])
+        if len(ids) != count or len(names) != count:
+            return None
+        metrics.record_io(self.filename, bytes_read=len(data), rows_read=count)
+        return ids, names, prices, quantities
+
+    def is_current(self, csv_stat):
+        """Cheap check (header only, no hash) that the cache was written
+        for the CSV described by ``csv_stat``."""
+        try:
+            with open(self.filename, mode='rb') as file:
+                data = file.read(self.header.size)
+        except FileNotFoundError:
+            return False
+        if len(data) < self.header.size:
+            return False
+        magic, size, mtime_ns = self.header.unpack_from(data)[:3]
+        return (magic == self.magic and size == csv_stat.st_size and
+                mtime_ns == csv_stat.st_mtime_ns)
+
+    def save(self, csv_filename, catalog):
+        """Cache ``catalog``, which must hold exactly what the CSV holds."""
+        if len(catalog.rows) == len(catalog.ids):
+            # No deleted rows: the columns can be written as they are.
+            ids, names = catalog.ids, catalog.names
+            prices, quantities = catalog.prices, catalog.quantities
+        else:
+            ids, names, prices, quantities = [], [], array('d'), array('q')
+            for product_id, name, price, quantity in catalog.iter_rows():
+                ids.append(product_id)
+                names.append(name)
+                prices.append(price)
+                quantities.append(quantity)
+        ids_blob = '\0'.join(ids).encode('utf-8')
+        names_blob = '\0'.join(names).encode('utf-8')
+        if ids and (ids_blob.count(b'\0') != len(ids) - 1 or
+                    names_blob.count(b'\0') != len(names) - 1):
+            # A NUL inside an id or name would split it when loading.
+            self.clear()
+            return
+
+        stat = os.stat(csv_filename)
+        header = self.header.pack(self.magic, stat.st_size, stat.st_mtime_ns, len(ids),
+                                  self.csv_digest(csv_filename), len(ids_blob), len(names_blob))
+        temp_filename = f"{self.filename}.{os.getpid()}.tmp"
+        with open(temp_filename, mode='wb') as file:
+            file.write(header)
+            file.write(ids_blob)
+            file.write(names_blob)
+            file.write(prices.tobytes())
+            file.write(quantities.tobytes())
+            written = file.tell()
+        os.replace(temp_filename, self.filename)
+        metrics.record_io(self.filename, bytes_written=written, rows_written=len(ids))
+
+    def clear(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+class CSVStorage:
+    """The original file layout: ``inventory.csv`` (plus its change journal),
+    ``sales_records.csv``, the line-item log and the day-partitioned sales
+    store under ``data/sales``.
+
+    ``transaction()`` holds an exclusive lock on ``inventory.csv.lock``, so
+    several processes (checkout lanes) can share the same files. Inside it,
+    ``poll_changes()`` reports what other processes appended to the journal,
+    or that the snapshot was rewritten and a full reload is needed.
+
+    With ``snapshot_cache`` the parsed snapshot is also kept in
+    ``inventory.csv.cache`` (see ``SnapshotCache``) and loaded from there
+    while it matches the CSV.
+    """
+
+    def __init__(self, filename='inventory.csv', journal=False,
+                 journal_max_entries=1000, journal_max_age=300,
+                 sales_file='sales_records.csv', sales_store=None, line_item_log=None,
+                 snapshot_cache=True):
+        self.filename = filename
+        self.cache = SnapshotCache(filename + '.cache') if snapshot_cache else None
+        # The journal file is always replayed and cleared on snapshot, even
+        # when journaling is off, so switching modes never loses changes.
+        self.journal = InventoryJournal(filename + '.journal',
+                                        journal_max_entries, journal_max_age)
+        self.journal_enabled = journal
+        self.lock = FileLock(filename + '.lock')
+        self.snapshot_stamp = None
+        self.sales_file = sales_file
+        self.sales_store = sales_store or SalesStore()
+        self.line_item_log = line_item_log or LineItemLog()
+        self.sales_history = SalesHistoryReader(sales_file)
+        self.analytics_cache = sales_file + '.analytics.npz'
+        self.velocity_file = os.path.join(os.path.dirname(sales_file), 'sales_velocity.csv')
+
+    def current_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def iter_snapshot(self):
+        self.snapshot_stamp = self.current_stamp()
+        if self.snapshot_stamp is None:
+            return
+        with open(self.filename, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            id_col, name_col, price_col, quantity_col = (
+                header.index(field) for field in ('product_id', 'name', 'price', 'quantity'))
+            for row in reader:
+                yield (row[id_col], row[name_col],
+                       float(row[price_col]), int(row[quantity_col]))
+            metrics.record_io(self.filename, bytes_read=self.snapshot_stamp[2],
+                              rows_read=reader.line_num - 1)
+
+    def load_cached_snapshot(self):
+        if self.cache is None:
+            return None
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        columns = self.cache.load(self.filename, stat)
+        if columns is not None:
+            self.snapshot_stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return columns
+
+    def cache_is_stale(self):
+        """True if the next load will parse the CSV and rewrite the
+        snapshot cache."""
+        if self.cache is None:
+            return False
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+        return not self.cache.is_current(stat)
+
+    def cache_snapshot(self, catalog):
+        if self.cache is not None and self.snapshot_stamp is not None:
+            self.cache.save(self.filename, catalog)
+
+    def iter_changes(self):
+        return self.journal.replay()
+
+    def poll_changes(self):
+        if self.current_stamp() != self.snapshot_stamp or \
+                self.journal.size() < self.journal.offset:
+            return True, []
+        return False, self.journal.read_new()
+
+    @timed('storage.save_snapshot')
+    def save_snapshot(self, catalog):
+        # Write the snapshot beside the live file and rename it into place so
+        # a crash mid-write never leaves a truncated inventory.csv behind.
+        with self.lock:
+            temp_filename = self.filename + '.tmp'
+            with open(temp_filename, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['product_id', 'name', 'price', 'quantity'])
+                writer.writerows(catalog.iter_rows())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_filename, self.filename)
+            self.snapshot_stamp = self.current_stamp()
+            self.journal.clear()
+            self.cache_snapshot(catalog)
+        metrics.record_io(self.filename, bytes_written=self.snapshot_stamp[2],
+                          rows_written=len(catalog))
+
+    @timed('storage.write_changes')
+    def write_changes(self, changes, catalog):
+        if not self.journal_enabled:
+            self.save_snapshot(catalog)
+            return
+        self.journal.append(changes)
+        if self.journal.needs_compaction():
+            self.save_snapshot(catalog)
+
+    def compact(self, catalog):
+        if self.journal.entries:
+            self.save_snapshot(catalog)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            yield self
+
+    def prepare_sales(self, products):
+        # products yields (product_id, name) pairs; it is only consumed when
+        # a legacy sales file needs converting.
+        with self.lock:
+            if has_legacy_details(self.sales_file):
+                ids_by_name = {}
+                for product_id, name in products:
+                    ids_by_name.setdefault(name, product_id)
+                convert_sales_records(self.sales_file, self.line_item_log, ids_by_name)
+            if not os.path.exists(self.sales_store.directory):
+                self.sales_store.rebuild_from(self.sales_file)
+
+    def record_sale(self, sale_record):
+        self.record_sales([sale_record])
+
+    @timed('storage.record_sales')
+    def record_sales(self, sale_records):
+        # One append per file for the whole group of orders.
+        with self.lock:
+            file_exists = os.path.exists(self.sales_file)
+            with open(self.sales_file, mode='a', newline='') as file:
+                start = file.tell()
+                fieldnames = ['order_id', 'datetime', 'items', 'total']
+                writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerows(sale_records)
+                file.flush()
+                os.fsync(file.fileno())
+                if metrics.enabled:
+                    metrics.record_io(self.sales_file, bytes_written=file.tell() - start,
+                                      rows_written=len(sale_records))
+            self.line_item_log.append([item for sale_record in sale_records
+                                       for item in sale_record['line_items']])
+            self.sales_store.add_sales(sale_records)
+
+    def get_day_totals(self, day):
+        return self.sales_store.get_day_totals(day)
+
+    def day_stamp(self, day):
+        return self.sales_store.day_stamp(day)
+
+    def get_range_totals(self, start_date, end_date):
+        return self.sales_store.get_range_totals(start_date, end_date)
+
+    def iter_sales(self, start=None, end=None):
+        return self.sales_history.iter_sales(start, end)
+
+    def iter_line_items(self):
+        return self.line_item_log.iter_items()
+
+    def read_new_sales(self, position=None):
+        return self.sales_history.read_new(position)
+
+    def read_new_line_items(self, position=None):
+        return self.line_item_log.read_new(position)
+
+    def close(self):
+        pass
+
+class SQLiteStorage:
+    """Catalog and sales in one SQLite database (WAL mode).
+
+    Products are looked up by primary key, orders are indexed by time,
+    and ``transaction()`` wraps a whole checkout (stock decrements, order
+    header, line items and daily totals) in a single ``BEGIN IMMEDIATE``
+    commit, which serializes checkouts across processes.
+
+    Every write stamps the rows it touches with a new ``version`` (deleted
+    ids go to ``deleted_products``), so ``poll_changes()`` can hand another
+    process just the rows changed since it last synced. A full snapshot
+    rewrite bumps ``generation`` instead, which asks for a reload.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS products (
+            product_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            quantity INTEGER NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS deleted_products (
+            product_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value)
+            VALUES ('version', 0), ('generation', 0), ('sales_generation', 0);
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            order_id TEXT NOT NULL,
+            order_time TEXT NOT NULL,
+            items INTEGER NOT NULL,
+            total REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS orders_by_time ON orders (order_time);
+        CREATE INDEX IF NOT EXISTS orders_by_id ON orders (order_id);
+        CREATE TABLE IF NOT EXISTS order_items (
+            order_id TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            subtotal REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS order_items_by_order ON order_items (order_id);
+        CREATE INDEX IF NOT EXISTS order_items_by_product ON order_items (product_id);
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day TEXT PRIMARY KEY,
+            num_orders INTEGER NOT NULL,
+            total_items INTEGER NOT NULL,
+            total_sales REAL NOT NULL
+        );
+    """
+
+    def __init__(self, database='data/inventory.db', check_same_thread=True):
+        self.database = database
+        directory = os.path.dirname(database)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # check_same_thread=False lets a caller that serializes access itself
+        # (the checkout service) use the connection from a worker thread.
+        self.connection = sqlite3.connect(database, isolation_level=None,
+                                          check_same_thread=check_same_thread)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # FULL syncs the WAL on every commit, so a recorded sale survives a
+        # power failure like the fsynced CSV files do.
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.executescript(self.schema)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(products)')]
+        if 'version' not in columns:
+            self.connection.execute(
+                'ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS products_by_version ON products (version)')
+        self.transaction_depth = 0
+        self.checkpoint_pending = False
+        self.synced_version = 0
+        self.synced_generation = 0
+        self.analytics_cache = database + '.analytics.npz'
+        self.velocity_file = os.path.join(directory, 'sales_velocity.csv')
+
+    @contextmanager
+    def transaction(self):
+        if self.transaction_depth == 0:
+            self.connection.execute('BEGIN IMMEDIATE')
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.connection.execute('ROLLBACK')
+            raise
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0:
+            self.connection.execute('COMMIT')
+            if self.checkpoint_pending:
+                self.checkpoint_pending = False
+                self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def get_meta(self, key):
+        return self.connection.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()[0]
+
+    def bump_meta(self, key):
+        self.connection.execute('UPDATE meta SET value = value + 1 WHERE key = ?', (key,))
+        return self.get_meta(key)
+
+    def iter_snapshot(self):
+        self.synced_version = self.get_meta('version')
+        self.synced_generation = self.get_meta('generation')
+        return self.connection.execute(
+            'SELECT product_id, name, price, quantity FROM products ORDER BY rowid')
+
+    def load_cached_snapshot(self):
+        return None
+
+    def cache_is_stale(self):
+        return False
+
+    def cache_snapshot(self, catalog):
+        pass
+
+    def iter_changes(self):
+        return iter(())
+
+    def poll_changes(self):
+        if self.get_meta('generation') != self.synced_generation:
+            return True, []
+        version = self.get_meta('version')
+        if version == self.synced_version:
+            return False, []
+        changes = [(InventoryJournal.UPSERT, product_id, name, price, quantity)
+                   for product_id, name, price, quantity in self.connection.execute(
+                       'SELECT product_id, name, price, quantity FROM products '
+                       'WHERE version > ? ORDER BY rowid', (self.synced_version,))]
+        changes.extend((InventoryJournal.DELETE, product_id, None, None, None)
+                       for (product_id,) in self.connection.execute(
+                           'SELECT product_id FROM deleted_products WHERE version > ?',
+                           (self.synced_version,)))
+        self.synced_version = version
+        metrics.record_io(self.database, rows_read=len(changes))
+        return False, changes
+
+    @timed('storage.save_snapshot')
+    def save_snapshot(self, catalog):
+        metrics.record_io(self.database, rows_written=len(catalog))
+        with self.transaction():
+            self.connection.execute('DELETE FROM products')
+            self.connection.execute('DELETE FROM deleted_products')
+            self.connection.executemany(
+                'INSERT INTO products (product_id, name, price, quantity) VALUES (?, ?, ?, ?)',
+                catalog.iter_rows())
+            self.synced_generation = self.bump_meta('generation')
+            self.synced_version = self.get_meta('version')
+
+    @timed('storage.write_changes')
+    def write_changes(self, changes, catalog):
+        metrics.record_io(self.database, rows_written=len(changes))
+        with self.transaction():
+            version = self.bump_meta('version')
+            upserts = [(product_id, product.name, product.price, product.quantity, version)
+                       for product_id, product in changes if product is not None]
+            deletes = [(product_id,) for product_id, product in changes if product is None]
+            self.connection.executemany(
+                'INSERT INTO products (product_id, name, price, quantity, version) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (product_id) DO UPDATE SET '
+                'name = excluded.name, price = excluded.price, '
+                'quantity = excluded.quantity, version = excluded.version',
+                upserts)
+            self.connection.executemany(
+                'DELETE FROM deleted_products WHERE product_id = ?',
+                [row[:1] for row in upserts])
+            self.connection.executemany(
+                'DELETE FROM products WHERE product_id = ?', deletes)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO deleted_products (product_id, version) VALUES (?, ?)',
+                [(product_id, version) for (product_id,) in deletes])
+            # Our own catalog already holds these rows.
+            if self.synced_version == version - 1:
+                self.synced_version = version
+
+    def compact(self, catalog):
+        # A checkpoint cannot run inside a transaction; run it after COMMIT.
+        if self.transaction_depth:
+            self.checkpoint_pending = True
+        else:
+            self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def prepare_sales(self, products):
+        pass
+
+    def record_sale(self, sale_record):
+        self.record_sales([sale_record])
+
+    @timed('storage.record_sales')
+    def record_sales(self, sale_records):
+        metrics.record_io(self.database, rows_written=len(sale_records))
+        with self.transaction():
+            self.connection.executemany(
+                'INSERT INTO orders (order_id, order_time, items, total) VALUES (?, ?, ?, ?)',
+                [(sale_record['order_id'], str(sale_record['datetime']),
+                  sale_record['items'], sale_record['total']) for sale_record in sale_records])
+            self.connection.executemany(
+                'INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(item['order_id'], item['product_id'], item['quantity'],
+                  item['unit_price'], item['subtotal'])
+                 for sale_record in sale_records for item in sale_record['line_items']])
+            self.connection.executemany(
+                'INSERT INTO daily_totals (day, num_orders, total_items, total_sales) '
+                'VALUES (?, 1, ?, ?) ON CONFLICT (day) DO UPDATE SET '
+                'num_orders = num_orders + 1, total_items = total_items + excluded.total_items, '
+                'total_sales = total_sales + excluded.total_sales',
+                [(sale_record['datetime'].date().isoformat(), sale_record['items'],
+                  sale_record['total']) for sale_record in sale_records])
+
+    def get_day_totals(self, day):
+        row = self.connection.execute(
+            'SELECT num_orders, total_items, total_sales FROM daily_totals WHERE day = ?',
+            (day.isoformat(),)).fetchone()
+        num_orders, total_items, total_sales = row or (0, 0, 0.0)
+        return {
+            'date': day,
+            'total_sales': total_sales,
+            'total_items': total_items,
+            'num_orders': num_orders
+        }
+
+    def day_stamp(self, day):
+        # The day's totals row is one indexed lookup and changes with every
+        # order recorded for the day.
+        return self.connection.execute(
+            'SELECT num_orders, total_items, total_sales FROM daily_totals WHERE day = ?',
+            (day.isoformat(),)).fetchone()
+
+    def get_range_totals(self, start_date, end_date):
+        found = {}
+        for day, num_orders, total_items, total_sales in self.connection.execute(
+                'SELECT day, num_orders, total_items, total_sales FROM daily_totals '
+                'WHERE day BETWEEN ? AND ?', (start_date.isoformat(), end_date.isoformat())):
+            found[day] = (num_orders, total_items, total_sales)
+        days = []
+        day = start_date
+        while day <= end_date:
+            num_orders, total_items, total_sales = found.get(day.isoformat(), (0, 0, 0.0))
+            days.append({
+                'date': day,
+                'total_sales': total_sales,
+                'total_items': total_items,
+                'num_orders': num_orders
+            })
+            day += timedelta(days=1)
+        return days
+
+    def iter_sales(self, start=None, end=None):
+        query = 'SELECT order_id, order_time, items, total FROM orders'
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('order_time >= ?')
+            params.append(str(start))
+        if end is not None:
+            conditions.append('order_time <= ?')
+            params.append(str(end))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        for order_id, order_time, items, total in self.connection.execute(
+                query + ' ORDER BY order_time', params):
+            yield {
+                'order_id': order_id,
+                'datetime': datetime.fromisoformat(order_time),
+                'items': items,
+                'total': total
+            }
+
+    def iter_line_items(self):
+        for order_id, product_id, quantity, unit_price, subtotal in self.connection.execute(
+                'SELECT order_id, product_id, quantity, unit_price, subtotal '
+                'FROM order_items ORDER BY rowid'):
+            yield {
+                'order_id': order_id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'subtotal': subtotal
+            }
+
+    def read_new_rows(self, query, position):
+        # Positions are (sales_generation, last rowid); a migration replaces
+        # the sales tables and bumps sales_generation, which restarts reading.
+        generation = self.get_meta('sales_generation')
+        last_id = position[1] if position is not None and position[0] == generation else 0
+        rows = self.connection.execute(query, (last_id,)).fetchall()
+        if rows:
+            last_id = rows[-1][0]
+        metrics.record_io(self.database, rows_read=len(rows))
+        return [row[1:] for row in rows], (generation, last_id)
+
+    def read_new_sales(self, position=None):
+        return self.read_new_rows(
+            'SELECT id, order_id, order_time, items, total FROM orders '
+            'WHERE id > ? ORDER BY id', position)
+
+    def read_new_line_items(self, position=None):
+        return self.read_new_rows(
+            'SELECT rowid, order_id, product_id, quantity, unit_price, subtotal '
+            'FROM order_items WHERE rowid > ? ORDER BY rowid', position)
+
+    def close(self):
+        self.connection.close()
+
+def migrate_csv_to_sqlite(csv_storage, sqlite_storage):
+    """Copy the catalog, orders and line items from CSV files into SQLite.
+
+    The SQLite tables are replaced, so the migration can be rerun. Daily
+    totals are rebuilt from the copied orders. Returns a dict of row counts.
+    """
+    products = {}
+    for product_id, name, price, quantity in csv_storage.iter_snapshot():
+        products[product_id] = (product_id, name, price, quantity)
+    for op, product_id, name, price, quantity in csv_storage.iter_changes():
+        if op == InventoryJournal.DELETE:
+            products.pop(product_id, None)
+        else:
+            products[product_id] = (product_id, name, price, quantity)
+
+    csv_storage.prepare_sales((row[0], row[1]) for row in products.values())
+
+    connection = sqlite_storage.connection
+    with sqlite_storage.transaction():
+        for table in ('products', 'deleted_products', 'orders', 'order_items',
+                      'daily_totals'):
+            connection.execute(f'DELETE FROM {table}')
+        connection.executemany(
+            'INSERT INTO products (product_id, name, price, quantity) VALUES (?, ?, ?, ?)',
+            products.values())
+        connection.executemany(
+            'INSERT INTO orders (order_id, order_time, items, total) VALUES (?, ?, ?, ?)',
+            ((sale['order_id'], str(sale['datetime']), sale['items'], sale['total'])
+             for sale in csv_storage.iter_sales()))
+        connection.executemany(
+            'INSERT INTO order_items (order_id, product_id, quantity, unit_price, subtotal) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((item['order_id'], item['product_id'], item['quantity'],
+              item['unit_price'], item['subtotal']) for item in csv_storage.iter_line_items()))
+        connection.execute(
+            'INSERT INTO daily_totals (day, num_orders, total_items, total_sales) '
+            'SELECT substr(order_time, 1, 10), COUNT(*), SUM(items), SUM(total) '
+            'FROM orders GROUP BY substr(order_time, 1, 10)')
+        sqlite_storage.bump_meta('generation')
+        sqlite_storage.bump_meta('sales_generation')
+    counts = {}
+    for table in ('products', 'orders', 'order_items'):
+        counts[table] = connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    return counts
@@ -4,6 +4,9 @@ Inventory Management & Billing System - Main Entry Point
 """
 
 from inventory_frontend import InventoryApp
+from inventory_storage import CSVStorage, SQLiteStorage, migrate_csv_to_sqlite
+from metrics import metrics
+import argparse
 import os
 import sys
 
@@ -20,19 +23,137 @@ def displaying_welcome():
     print(f"Python {sys.version.split()[0]}".center(50))
     print("=" * 50 + "\n")
 
+def parse_arguments():
+    """Read storage options from the command line or INVENTORY_STORAGE"""
+    parser = argparse.ArgumentParser(description="Inventory Management & Billing System")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'],
+                        default=os.environ.get('INVENTORY_STORAGE', 'csv'),
+                        help="storage backend (default: csv, or $INVENTORY_STORAGE)")
+    parser.add_argument('--database', default=os.path.join('data', 'inventory.db'),
+                        help="SQLite database file for --storage sqlite")
+    parser.add_argument('--store', metavar='STORE_ID',
+                        help="run against one store's inventory under data/stores/STORE_ID")
+    parser.add_argument('--migrate', action='store_true',
+                        help="copy the CSV inventory and sales history into the SQLite database")
+    parser.add_argument('--metrics', action='store_true',
+                        help="collect operation timings and file I/O counts (Reports menu)")
+    parser.add_argument('--metrics-file',
+                        help="also dump metrics to this file periodically (.prom for Prometheus text, else JSON)")
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help="seconds between metrics dumps (default: 60)")
+    parser.add_argument('--page-size', type=int, default=20,
+                        help="products per page in listings (default: 20)")
+    parser.add_argument('--batch', metavar='JOBS',
+                        help="apply a JSON Lines file of orders, product changes and reports, then exit")
+    parser.add_argument('--rejects',
+                        help="file for jobs that could not be applied (default: JOBS.rejects.jsonl)")
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help="jobs applied and saved together in --batch mode (default: 500)")
+    parser.add_argument('--save-bills', choices=['txt', 'csv', 'pdf'],
+                        help="save a bill under bills/ for every --batch order")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes for writing bills and reports in --batch mode (default: none)")
+    args = parser.parse_args()
+    if args.store:
+        from store_inventory import store_directory
+        try:
+            store_directory(args.store)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+def create_storage(args):
+    """Build the storage backend selected on the command line"""
+    if args.store:
+        # Imported here: store_inventory pulls in multiprocessing, which only
+        # --store needs.
+        from store_inventory import store_directory, store_storage
+        directory = store_directory(args.store)
+        if args.storage == 'csv':
+            return store_storage(directory)
+        storage, source = store_storage(directory, 'sqlite'), store_storage(directory)
+    elif args.storage == 'csv':
+        return CSVStorage(journal=True)
+    else:
+        storage, source = SQLiteStorage(args.database), CSVStorage()
+
+    if args.migrate:
+        counts = migrate_csv_to_sqlite(source, storage)
+        print(f"Migrated {counts['products']} products, {counts['orders']} orders "
+              f"and {counts['order_items']} line items into {storage.database}")
+    return storage
+
+def run_batch(args):
+    """Apply a jobs file without prompts; exits 1 if any job was rejected"""
+    from concurrent.futures import ProcessPoolExecutor
+    from batch_jobs import BatchRunner
+    from bill_writer import BillWriter, PooledBillWriter
+    from inventory_backend import InventoryManager
+    from sales_velocity import SalesVelocity
+
+    inventory_manager = InventoryManager(storage=create_storage(args))
+    velocity = SalesVelocity(inventory_manager)
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 0 else None
+    bill_writer = None
+    if args.save_bills:
+        bill_writer = PooledBillWriter(executor) if executor else BillWriter()
+    rejects_file = args.rejects or args.batch + '.rejects.jsonl'
+    try:
+        with open(rejects_file, mode='w', encoding='utf-8') as rejects:
+            runner = BatchRunner(inventory_manager, rejects, args.chunk_size, bill_writer,
+                                 args.save_bills or 'txt', velocity, executor)
+            counts = runner.run(args.batch)
+    finally:
+        if bill_writer is not None:
+            bill_writer.close()
+        if executor is not None:
+            executor.shutdown()
+        velocity.save()
+
+    seconds = counts['seconds']
+    print(f"{counts['rows']} jobs in {seconds:.2f}s "
+          f"({counts['rows'] / seconds if seconds else 0:.0f} rows/sec): "
+          f"{counts['order']} orders, {counts['upsert']} upserts, {counts['delete']} deletes, "
+          f"{counts['report']} reports, {counts['rejected']} rejected")
+    if counts['rejected']:
+        print(f"Rejected jobs written to {rejects_file}")
+        sys.exit(1)
+    os.remove(rejects_file)
+
 def main():
+    args = parse_arguments()
+
+    if args.batch:
+        ensure_data_directories()
+        if args.metrics or args.metrics_file:
+            metrics.enable()
+        if args.metrics_file:
+            metrics.start_dumping(args.metrics_file, args.metrics_interval)
+        try:
+            run_batch(args)
+        finally:
+            metrics.stop_dumping()
+        return
+
     # Initialize system requirements
     ensure_data_directories()
     displaying_welcome()
     
+    if args.metrics or args.metrics_file:
+        metrics.enable()
+    if args.metrics_file:
+        metrics.start_dumping(args.metrics_file, args.metrics_interval)
+    
     # Start the application
     try:
-        app = InventoryApp()
+        app = InventoryApp(create_storage(args), args.page_size)
     except KeyboardInterrupt:
         print("\n\nApplication terminated by user.")
     except Exception as e:
         print(f"\nError starting application: {str(e)}")
         sys.exit(1)
+    finally:
+        metrics.stop_dumping()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,224 @@
+"""
+Operation timing and file I/O instrumentation
+"""
+
+import bisect
+from functools import wraps
+import json
+import os
+import sys
+import threading
+import time
+
+# Functions marked with @timed, instrumented only while metrics are on.
+instrumented = []
+
+class Histogram:
+    """Latency histogram with fixed millisecond buckets."""
+
+    bounds = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+              25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the percentile; the slowest
+        # bucket has no bound, so report the largest value seen.
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.50),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max,
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['inf'], self.counts))
+        }
+
+class Metrics:
+    """Process-wide latency histograms and per-file I/O counters.
+
+    Off by default. ``enable()`` swaps timing wrappers in for every
+    ``@timed`` function and ``disable()`` puts the originals back, so a
+    disabled process runs the plain functions. ``record_io`` returns at once
+    while disabled; call sites that would need extra work (a stat, a tell)
+    to measure bytes check ``enabled`` themselves first.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.dumper = None
+        self.dumper_stop = None
+        self.reset()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for function in instrumented:
+            owner, attribute = find_owner(function)
+            setattr(owner, attribute, timing_wrapper(function))
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for function in instrumented:
+            owner, attribute = find_owner(function)
+            setattr(owner, attribute, function)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            # filename -> [bytes_read, bytes_written, rows_read, rows_written]
+            self.files = {}
+            self.started = time.time()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    def record_io(self, filename, bytes_read=0, bytes_written=0, rows_read=0, rows_written=0):
+        if not self.enabled:
+            return
+        with self.lock:
+            counters = self.files.get(filename)
+            if counters is None:
+                counters = self.files[filename] = [0, 0, 0, 0]
+            counters[0] += bytes_read
+            counters[1] += bytes_written
+            counters[2] += rows_read
+            counters[3] += rows_written
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'since': self.started,
+                'taken': time.time(),
+                'operations': {name: histogram.summary()
+                               for name, histogram in sorted(self.histograms.items())},
+                'files': {filename: dict(zip(['bytes_read', 'bytes_written',
+                                              'rows_read', 'rows_written'], counters))
+                          for filename, counters in sorted(self.files.items())}
+            }
+
+    def report_lines(self):
+        snapshot = self.snapshot()
+        lines = ["Operation                         Calls    Mean ms     p50 ms     p99 ms     Max ms"]
+        for name, summary in snapshot['operations'].items():
+            lines.append(f"{name:<30}{summary['count']:>8}{summary['mean_ms']:>11.3f}"
+                         f"{summary['p50_ms']:>11.3f}{summary['p99_ms']:>11.3f}"
+                         f"{summary['max_ms']:>11.3f}")
+        lines.append("")
+        lines.append("File                              Read B   Written B   Rows read  Rows written")
+        for filename, counters in snapshot['files'].items():
+            if len(filename) > 30:
+                filename = '...' + filename[-27:]
+            lines.append(f"{filename:<30}{counters['bytes_read']:>10}"
+                         f"{counters['bytes_written']:>12}{counters['rows_read']:>12}"
+                         f"{counters['rows_written']:>14}")
+        return lines
+
+    def prometheus_lines(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, summary in snapshot['operations'].items():
+            label = f'operation="{name}"'
+            cumulative = 0
+            for bound, count in summary['buckets'].items():
+                cumulative += count
+                le = '+Inf' if bound == 'inf' else bound
+                lines.append(f'inventory_operation_ms_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'inventory_operation_ms_sum{{{label}}} {summary["total_ms"]}')
+            lines.append(f'inventory_operation_ms_count{{{label}}} {summary["count"]}')
+        for filename, counters in snapshot['files'].items():
+            for field, value in counters.items():
+                lines.append(f'inventory_file_{field}_total{{file="{filename}"}} {value}')
+        return lines
+
+    def dump(self, filename):
+        """Write the current metrics atomically: Prometheus text format for
+        a ``.prom`` file, JSON otherwise."""
+        if filename.endswith('.prom'):
+            content = '\n'.join(self.prometheus_lines()) + '\n'
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, 'w') as file:
+            file.write(content)
+        os.replace(temp_filename, filename)
+
+    def start_dumping(self, filename, interval=60):
+        self.stop_dumping()
+        stop = threading.Event()
+        def run():
+            while not stop.wait(interval):
+                self.dump(filename)
+            self.dump(filename)
+        self.dumper_stop = stop
+        self.dumper = threading.Thread(target=run, daemon=True)
+        self.dumper.start()
+
+    def stop_dumping(self):
+        if self.dumper is not None:
+            self.dumper_stop.set()
+            self.dumper.join()
+            self.dumper = None
+
+metrics = Metrics()
+
+def timed(name):
+    """Record each call's latency under ``name`` while metrics are on.
+
+    For module-level functions and methods of module-level classes; the
+    function is left as is until ``metrics.enable()``. Modules imported
+    after that (lazily) get the wrapper straight away.
+    """
+    def decorator(function):
+        function.metric_name = name
+        instrumented.append(function)
+        if metrics.enabled:
+            return timing_wrapper(function)
+        return function
+    return decorator
+
+def find_owner(function):
+    owner = sys.modules[function.__module__]
+    *path, attribute = function.__qualname__.split('.')
+    for part in path:
+        owner = getattr(owner, part)
+    return owner, attribute
+
+def timing_wrapper(function):
+    name = function.metric_name
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - started)
+    return wrapper
@@ -0,0 +1,93 @@
+"""
+Collision-free, sortable order IDs
+"""
+
+from datetime import datetime, timezone
+import os
+import threading
+
+class OrderIdGenerator:
+    """Order IDs of the form ``YYYYMMDDHHMMSSmmm-LLLLLLL-SSSS``.
+
+    The UTC time to the millisecond, the lane (the process id unless a lane
+    number is given) and a per-millisecond sequence. IDs from one generator
+    are strictly increasing, even if the clock steps back; two processes
+    differ in the lane. Up to 10,000 IDs fit in one millisecond; beyond that
+    the generator borrows the next millisecond. IDs are 30 characters, safe
+    in file names and in the binary line-item log.
+    """
+
+    sequence_limit = 10000
+
+    def __init__(self, lane=None):
+        self.lane = lane
+        self.last_millis = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self, when=None):
+        when = when or datetime.now()
+        millis = int(when.timestamp() * 1000)
+        with self.lock:
+            if millis <= self.last_millis:
+                millis = self.last_millis
+                self.sequence += 1
+                if self.sequence == self.sequence_limit:
+                    millis += 1
+                    self.sequence = 0
+            else:
+                self.sequence = 0
+            self.last_millis = millis
+            sequence = self.sequence
+
+        # Read the pid per call so a forked worker gets its own lane.
+        lane = self.lane if self.lane is not None else os.getpid()
+        stamp = datetime.fromtimestamp(millis // 1000, timezone.utc)
+        return f"{stamp:%Y%m%d%H%M%S}{millis % 1000:03d}-{lane:07d}-{sequence:04d}"
+
+# Shared by every OrderManager in the process, so carts served side by side
+# (e.g. by the checkout service) never draw the same sequence number.
+default_generator = OrderIdGenerator()
+
+def next_order_id(when=None):
+    return default_generator.next_id(when)
+
+def generate_ids(count, threads):
+    generated = []
+    def run():
+        ids = [next_order_id() for _ in range(count)]
+        # Each thread sees its own IDs in increasing order.
+        if ids != sorted(ids):
+            raise AssertionError("order ids went backwards")
+        generated.append(ids)
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [order_id for ids in generated for order_id in ids]
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+    import time
+
+    parser = argparse.ArgumentParser(description="Stress test the order id generator")
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4, help="threads per process")
+    parser.add_argument('--ids', type=int, default=20000, help="ids per thread")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.processes) as pool:
+        results = list(pool.map(generate_ids, [args.ids] * args.processes,
+                                [args.threads] * args.processes))
+    elapsed = time.perf_counter() - started
+
+    all_ids = [order_id for ids in results for order_id in ids]
+    collisions = len(all_ids) - len(set(all_ids))
+    print(f"{len(all_ids)} ids from {args.processes} processes x {args.threads} threads "
+          f"in {elapsed:.2f}s ({len(all_ids) / elapsed:,.0f} ids/sec)")
+    print(f"Collisions: {collisions}")
+    if collisions:
+        raise SystemExit(1)
@@ -0,0 +1,135 @@
+"""
+Memoized report results with precise invalidation
+"""
+
+from collections import OrderedDict
+import csv
+import os
+
+from metrics import metrics, timed
+
+class ReportCache:
+    """Recently run reports, keyed by (report, parameters), least recently
+    used evicted first once there are ``max_entries``.
+
+    A daily sales entry carries the storage's ``day_stamp`` for its day and
+    is recomputed only when that stamp changes, so an order (from this or
+    any other checkout lane) invalidates the entry for its own day and no
+    other. A low stock entry for threshold ``t`` is dropped when a product
+    it lists changes, or a changed product is now at or below ``t``; stock
+    changes anywhere else leave it alone. A reconciliation of a day against
+    the sales history is kept like a daily sales entry.
+
+    ``export_csv`` skips rewriting a report file whose rows are the same as
+    when this cache last wrote it, as long as the file has not been touched
+    since.
+    """
+
+    def __init__(self, inventory_manager, max_entries=64):
+        self.inventory = inventory_manager
+        self.storage = inventory_manager.storage
+        self.max_entries = max_entries
+        # key -> (result, stamp, product ids listed)
+        self.entries = OrderedDict()
+        # filename -> (hash of the rows, file stamp after writing)
+        self.exports = {}
+        self.hits = 0
+        self.misses = 0
+        inventory_manager.add_change_listener(self.stock_changed)
+
+    def lookup(self, key, stamp=None):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] != stamp:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def store(self, key, result, stamp=None, product_ids=None):
+        self.entries[key] = (result, stamp, product_ids)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    @timed('reports.daily_sales')
+    def daily_sales(self, day):
+        """``get_day_totals(day)``, recomputed only after an order for ``day``."""
+        key = ('daily_sales', day)
+        # Stamp before totals: storages update a day's totals before its
+        # stamp, so at worst newer totals are cached under the older stamp
+        # and recomputed on the next call, never the other way round.
+        stamp = self.storage.day_stamp(day)
+        report = self.lookup(key, stamp)
+        if report is None:
+            report = self.storage.get_day_totals(day)
+            self.store(key, report, stamp)
+        return report
+
+    @timed('reports.reconcile_sales')
+    def reconcile_sales(self, order_manager, day):
+        """``order_manager.reconcile_sales(day)``, rerun only after an order
+        for ``day``."""
+        key = ('reconcile_sales', day)
+        stamp = self.storage.day_stamp(day)
+        mismatches = self.lookup(key, stamp)
+        if mismatches is None:
+            mismatches = order_manager.reconcile_sales(day)
+            self.store(key, mismatches, stamp)
+        return mismatches
+
+    @timed('reports.low_stock')
+    def low_stock(self, threshold):
+        """``(product_id, name, quantity)`` for every product at or below
+        ``threshold``, in catalog order."""
+        key = ('low_stock', threshold)
+        rows = self.lookup(key)
+        if rows is None:
+            rows = tuple((product.product_id, product.name, product.quantity)
+                         for product in self.inventory.get_low_stock_products(threshold))
+            self.store(key, rows, product_ids=frozenset(row[0] for row in rows))
+        return rows
+
+    def stock_changed(self, product_ids):
+        if product_ids is None:
+            stale = [key for key, entry in self.entries.items() if entry[2] is not None]
+        else:
+            quantities = {}
+            for product_id in product_ids:
+                product = self.inventory.get_product(product_id)
+                quantities[product_id] = product.quantity if product is not None else None
+            stale = []
+            for key, (_, _, listed) in self.entries.items():
+                if listed is None:
+                    continue
+                threshold = key[1]
+                for product_id, quantity in quantities.items():
+                    if product_id in listed or quantity is not None and quantity <= threshold:
+                        stale.append(key)
+                        break
+        for key in stale:
+            del self.entries[key]
+
+    def file_stamp(self, filename):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def export_csv(self, filename, header, rows):
+        """Write ``header`` and ``rows`` to ``filename`` unless this cache
+        already wrote exactly these rows there. Returns True if written."""
+        rows = [list(row) for row in rows]
+        fingerprint = hash((tuple(header), tuple(map(tuple, rows))))
+        exported = self.exports.get(filename)
+        if exported is not None and exported == (fingerprint, self.file_stamp(filename)):
+            return False
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(header)
+            writer.writerows(rows)
+            written = csvfile.tell()
+        self.exports[filename] = (fingerprint, self.file_stamp(filename))
+        metrics.record_io(filename, bytes_written=written, rows_written=len(rows))
+        return True
@@ -0,0 +1,241 @@
+"""
+Vectorized sales analytics over the order history and line-item log
+"""
+
+from datetime import timedelta
+from itertools import repeat
+import os
+
+from metrics import metrics, timed
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class SalesAnalytics:
+    """Sales history held as NumPy columns for range, per-day, per-product
+    and hourly reports.
+
+    Orders (time, items, total) and line items (time, product, quantity,
+    subtotal) are read from the storage once and then topped up with what
+    was appended since (``refresh``), so a report only masks and aggregates
+    arrays. A line item takes its time from its order. Order counts and
+    revenue come from the orders, after discounts; per-product revenue is
+    the sum of line subtotals, before discounts. Line items without a
+    recorded order are left out.
+
+    With ``cache_file`` the columns and read positions are saved as an
+    ``.npz`` file whenever a refresh has read ``cache_every`` rows or more,
+    so a new session only parses what was sold since.
+    """
+
+    cache_every = 10000
+
+    def __init__(self, storage, cache_file=None):
+        if np is None:
+            raise ImportError("Sales analytics need NumPy: pip install numpy")
+        self.storage = storage
+        self.cache_file = cache_file
+        self.sales_position = None
+        self.items_position = None
+        self.clear_orders()
+        self.clear_items()
+        if cache_file:
+            self.load_cache()
+
+    def clear_orders(self):
+        self.order_ids = []
+        self.order_rows = {}
+        self.order_times = np.empty(0, dtype='datetime64[s]')
+        self.order_items = np.empty(0, dtype=np.int64)
+        self.order_totals = np.empty(0, dtype=np.float64)
+
+    def clear_items(self):
+        self.product_ids = []
+        self.product_codes = {}
+        self.item_times = np.empty(0, dtype='datetime64[s]')
+        self.item_products = np.empty(0, dtype=np.int64)
+        self.item_quantities = np.empty(0, dtype=np.int64)
+        self.item_subtotals = np.empty(0, dtype=np.float64)
+
+    @timed('analytics.refresh')
+    def refresh(self):
+        """Load whatever the storage appended since the last refresh."""
+        # Line items are written after their order, so reading them first
+        # means every line item read here has its order in place by the
+        # time the orders are read.
+        items, items_position = self.storage.read_new_line_items(self.items_position)
+        orders, sales_position = self.storage.read_new_sales(self.sales_position)
+        if not (same_source(self.items_position, items_position) and
+                same_source(self.sales_position, sales_position)):
+            # The history was rewritten; start over.
+            self.clear_orders()
+            self.clear_items()
+            items, items_position = self.storage.read_new_line_items(None)
+            orders, sales_position = self.storage.read_new_sales(None)
+        self.items_position = items_position
+        self.sales_position = sales_position
+        self.add_orders(orders)
+        self.add_items(items)
+        if self.cache_file and len(orders) + len(items) >= self.cache_every:
+            self.save_cache()
+
+    def add_orders(self, orders):
+        if not orders:
+            return
+        order_ids, times, items, totals = zip(*orders)
+        start = len(self.order_ids)
+        self.order_ids.extend(order_ids)
+        self.order_rows.update(zip(order_ids, range(start, start + len(order_ids))))
+        self.order_times = np.concatenate(
+            [self.order_times, np.array(times, dtype='datetime64[s]')])
+        self.order_items = np.concatenate(
+            [self.order_items, np.array(items, dtype=np.int64)])
+        self.order_totals = np.concatenate(
+            [self.order_totals, np.array(totals, dtype=np.float64)])
+
+    def add_items(self, items):
+        if not items:
+            return
+        order_ids, product_ids, quantities, unit_prices, subtotals = zip(*items)
+        rows = np.fromiter(map(self.order_rows.get, order_ids, repeat(-1)),
+                           dtype=np.int64, count=len(order_ids))
+        matched = rows >= 0
+
+        codes = self.product_codes
+        for product_id in dict.fromkeys(product_ids):
+            if product_id not in codes:
+                codes[product_id] = len(self.product_ids)
+                self.product_ids.append(product_id)
+        products = np.fromiter(map(codes.__getitem__, product_ids),
+                               dtype=np.int64, count=len(product_ids))
+
+        self.item_times = np.concatenate([self.item_times, self.order_times[rows[matched]]])
+        self.item_products = np.concatenate([self.item_products, products[matched]])
+        self.item_quantities = np.concatenate(
+            [self.item_quantities, np.array(quantities, dtype=np.int64)[matched]])
+        self.item_subtotals = np.concatenate(
+            [self.item_subtotals, np.array(subtotals, dtype=np.float64)[matched]])
+
+    def load_cache(self):
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as cache:
+                columns = {name: cache[name] for name in cache.files}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError):
+            # Unreadable (e.g. half written by an older version); rebuild it.
+            return
+        positions = columns['positions'].tolist()
+        self.items_position = tuple(positions[:2]) if positions[0] >= 0 else None
+        self.sales_position = tuple(positions[2:]) if positions[2] >= 0 else None
+        self.order_ids = columns['order_ids'].tolist()
+        self.order_rows = dict(zip(self.order_ids, range(len(self.order_ids))))
+        self.order_times = columns['order_times']
+        self.order_items = columns['order_items']
+        self.order_totals = columns['order_totals']
+        self.product_ids = columns['product_ids'].tolist()
+        self.product_codes = dict(zip(self.product_ids, range(len(self.product_ids))))
+        self.item_times = columns['item_times']
+        self.item_products = columns['item_products']
+        self.item_quantities = columns['item_quantities']
+        self.item_subtotals = columns['item_subtotals']
+        metrics.record_io(self.cache_file, bytes_read=os.path.getsize(self.cache_file),
+                          rows_read=len(self.order_ids) + len(self.item_times))
+
+    def save_cache(self):
+        positions = np.array((self.items_position or (-1, -1)) +
+                             (self.sales_position or (-1, -1)), dtype=np.int64)
+        temp_filename = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(temp_filename, mode='wb') as file:
+            np.savez(file, positions=positions,
+                     order_ids=np.array(self.order_ids, dtype=str),
+                     order_times=self.order_times, order_items=self.order_items,
+                     order_totals=self.order_totals,
+                     product_ids=np.array(self.product_ids, dtype=str),
+                     item_times=self.item_times, item_products=self.item_products,
+                     item_quantities=self.item_quantities, item_subtotals=self.item_subtotals)
+            written = file.tell()
+        os.replace(temp_filename, self.cache_file)
+        metrics.record_io(self.cache_file, bytes_written=written,
+                          rows_written=len(self.order_ids) + len(self.item_times))
+
+    def day_bounds(self, start_date, end_date):
+        return (np.datetime64(start_date, 'D'),
+                np.datetime64(end_date + timedelta(days=1), 'D'))
+
+    def select(self, times, start_date, end_date):
+        low, high = self.day_bounds(start_date, end_date)
+        return (times >= low) & (times < high)
+
+    @timed('analytics.range_summary')
+    def range_summary(self, start_date, end_date):
+        orders = self.select(self.order_times, start_date, end_date)
+        items = self.select(self.item_times, start_date, end_date)
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'num_orders': int(orders.sum()),
+            'total_items': int(self.order_items[orders].sum()),
+            'total_sales': float(self.order_totals[orders].sum()),
+            'products_sold': int(np.count_nonzero(
+                np.bincount(self.item_products[items], minlength=len(self.product_ids))))
+        }
+
+    @timed('analytics.daily_breakdown')
+    def daily_breakdown(self, start_date, end_date):
+        """One dict per day from ``start_date`` to ``end_date``, in the shape
+        of ``OrderManager.get_sales_range``."""
+        low, high = self.day_bounds(start_date, end_date)
+        days = int((high - low) / np.timedelta64(1, 'D'))
+        orders = self.select(self.order_times, start_date, end_date)
+        day_index = (self.order_times[orders].astype('datetime64[D]') - low).astype(np.int64)
+        num_orders = np.bincount(day_index, minlength=days)
+        total_items = np.bincount(day_index, self.order_items[orders], minlength=days)
+        total_sales = np.bincount(day_index, self.order_totals[orders], minlength=days)
+        return [{
+            'date': start_date + timedelta(days=day),
+            'num_orders': int(num_orders[day]),
+            'total_items': int(total_items[day]),
+            'total_sales': float(total_sales[day])
+        } for day in range(days)]
+
+    @timed('analytics.product_breakdown')
+    def product_breakdown(self, start_date, end_date, limit=None, by='total_sales'):
+        """``(product_id, units, total_sales)`` for every product sold in the
+        range, best sellers first (by revenue, or by units with
+        ``by='units'``); the first ``limit`` only if given."""
+        items = self.select(self.item_times, start_date, end_date)
+        products = self.item_products[items]
+        units = np.bincount(products, self.item_quantities[items],
+                            minlength=len(self.product_ids))
+        sales = np.bincount(products, self.item_subtotals[items],
+                            minlength=len(self.product_ids))
+        sold = np.flatnonzero(np.bincount(products, minlength=len(self.product_ids)))
+        key = units[sold] if by == 'units' else sales[sold]
+        if limit is not None and 0 < limit < sold.size:
+            top = np.argpartition(-key, limit - 1)[:limit]
+            sold, key = sold[top], key[top]
+        order = np.argsort(-key, kind='stable')
+        return [(self.product_ids[code], int(units[code]), float(sales[code]))
+                for code in sold[order]]
+
+    @timed('analytics.hourly_heatmap')
+    def hourly_heatmap(self, start_date, end_date):
+        """Orders and revenue by weekday (rows, Monday first) and hour of the
+        day (columns), as two 7x24 arrays."""
+        orders = self.select(self.order_times, start_date, end_date)
+        seconds = self.order_times[orders].astype(np.int64)
+        # 1970-01-01 was a Thursday (weekday 3).
+        cells = ((seconds // 86400 + 3) % 7) * 24 + seconds // 3600 % 24
+        num_orders = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+        total_sales = np.bincount(cells, self.order_totals[orders],
+                                  minlength=7 * 24).reshape(7, 24)
+        return num_orders, total_sales
+
+def same_source(old_position, new_position):
+    # A changed inode (CSV) or sales generation (SQLite) means the history
+    # was rewritten or removed.
+    return old_position is None or (new_position is not None and
+                                    old_position[0] == new_position[0])
@@ -0,0 +1,193 @@
+"""
+Streaming, range-bounded reader for sales_records.csv
+"""
+
+import bisect
+import csv
+from datetime import datetime
+import mmap
+import os
+
+from metrics import metrics
+
+class SalesHistoryReader:
+    """Yield orders from ``sales_records.csv`` lazily, optionally within a
+    datetime range.
+
+    A sparse index next to the file (``<file>.idx``) records the byte offset
+    and datetime of every ``index_every``-th row, so a range read seeks close
+    to its start instead of parsing the file from the top. The index is
+    extended incrementally as the file grows. Rows are assumed to be in
+    append (chronological) order, which is how ``OrderManager`` writes them.
+    """
+
+    def __init__(self, filename='sales_records.csv', index_every=1000):
+        self.filename = filename
+        self.index_filename = filename + '.idx'
+        self.index_every = index_every
+        self.data_start = 0
+        self.indexed_size = 0
+        self.rows_since_mark = 0
+        self.mark_offsets = []
+        self.mark_times = []
+        self.load_index()
+
+    def load_index(self):
+        if not os.path.exists(self.index_filename):
+            return
+        with open(self.index_filename, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            try:
+                header = next(reader)
+                self.data_start = int(header[0])
+                self.indexed_size = int(header[1])
+                self.rows_since_mark = int(header[2])
+                for offset, timestamp in reader:
+                    self.mark_offsets.append(int(offset))
+                    self.mark_times.append(timestamp)
+            except (StopIteration, ValueError, IndexError):
+                self.reset_index()
+
+    def save_index(self):
+        temp_filename = f"{self.index_filename}.{os.getpid()}.tmp"
+        with open(temp_filename, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([self.data_start, self.indexed_size, self.rows_since_mark])
+            writer.writerows(zip(self.mark_offsets, self.mark_times))
+        os.replace(temp_filename, self.index_filename)
+
+    def reset_index(self):
+        self.data_start = 0
+        self.indexed_size = 0
+        self.rows_since_mark = 0
+        self.mark_offsets = []
+        self.mark_times = []
+
+    def open_buffer(self, file):
+        # mmap avoids copying the whole file through Python's I/O buffers; it
+        # is unavailable for empty files, where the plain file object works.
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return file
+
+    def index_is_valid(self, buffer, size):
+        if size < self.indexed_size:
+            return False
+        if not self.mark_offsets:
+            return True
+        buffer.seek(self.mark_offsets[-1])
+        line = buffer.readline().decode('utf-8')
+        return line.split(',', 2)[1:2] == [self.mark_times[-1]]
+
+    def refresh_index(self, buffer, size):
+        if not self.index_is_valid(buffer, size):
+            self.reset_index()
+        if self.indexed_size == size:
+            return
+
+        if self.indexed_size == 0:
+            buffer.seek(0)
+            buffer.readline()
+            self.data_start = self.indexed_size = buffer.tell()
+
+        buffer.seek(self.indexed_size)
+        while True:
+            offset = buffer.tell()
+            line = buffer.readline()
+            if not line.endswith(b'\n'):
+                # Stop before a partially written last row; it is indexed
+                # on a later refresh once the writer has finished it.
+                break
+            if self.rows_since_mark == 0:
+                self.mark_offsets.append(offset)
+                self.mark_times.append(line.decode('utf-8').split(',', 2)[1])
+            self.rows_since_mark = (self.rows_since_mark + 1) % self.index_every
+            self.indexed_size = buffer.tell()
+        self.save_index()
+
+    def seek_offset(self, start):
+        if start is None:
+            return self.data_start
+        position = bisect.bisect_left(self.mark_times, str(start)) - 1
+        if position < 0:
+            return self.data_start
+        return self.mark_offsets[position]
+
+    def iter_sales(self, start=None, end=None):
+        """Yield sale records with ``start <= datetime <= end``."""
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, mode='rb') as file:
+            buffer = self.open_buffer(file)
+            start_offset = count = 0
+            try:
+                size = os.fstat(file.fileno()).st_size
+                self.refresh_index(buffer, size)
+                buffer.seek(0)
+                fieldnames = next(csv.reader([buffer.readline().decode('utf-8')]))
+                start_offset = self.seek_offset(start)
+                buffer.seek(start_offset)
+                lines = iter(buffer.readline, b'')
+                rows = csv.reader(line.decode('utf-8') for line in lines)
+                for row in rows:
+                    if len(row) < 4:
+                        continue
+                    record = dict(zip(fieldnames, row))
+                    order_time = datetime.fromisoformat(record['datetime'])
+                    if start is not None and order_time < start:
+                        continue
+                    if end is not None and order_time > end:
+                        break
+                    record['datetime'] = order_time
+                    record['items'] = int(record['items'])
+                    record['total'] = float(record['total'])
+                    count += 1
+                    yield record
+            finally:
+                metrics.record_io(self.filename, rows_read=count,
+                                  bytes_read=max(buffer.tell() - start_offset, 0))
+                if buffer is not file:
+                    buffer.close()
+
+    def read_new(self, position=None):
+        """Orders appended since ``position`` as ``(order_id, datetime,
+        items, total)`` string tuples, and the position to pass next time
+        (see ``read_appended``)."""
+        data, position = read_appended(self.filename, position)
+        rows = [tuple(row[:4]) for row in csv.reader(data.decode('utf-8').splitlines())
+                if len(row) >= 4]
+        metrics.record_io(self.filename, bytes_read=len(data), rows_read=len(rows))
+        return rows, position
+
+def read_appended(filename, position=None, record_size=None):
+    """Bytes appended to ``filename`` since ``position``, and the new position.
+
+    ``position`` is ``(inode, offset)``, or None to read from the top (past
+    the header line unless ``record_size`` is given). Only complete lines
+    (or whole ``record_size`` records) are returned; a row still being
+    written is picked up by a later call. If the file was replaced or
+    truncated since ``position``, reading starts over from the top, and the
+    changed inode in the returned position tells the caller so.
+    """
+    try:
+        file = open(filename, mode='rb')
+    except FileNotFoundError:
+        return b'', None
+    with file:
+        stat = os.fstat(file.fileno())
+        offset = 0
+        if position is not None and position[0] == stat.st_ino and position[1] <= stat.st_size:
+            offset = position[1]
+        if offset == 0 and record_size is None:
+            header = file.readline()
+            if not header.endswith(b'\n'):
+                return b'', (stat.st_ino, 0)
+            offset = file.tell()
+        file.seek(offset)
+        data = file.read(stat.st_size - offset)
+    if record_size is None:
+        data = data[:data.rfind(b'\n') + 1]
+    else:
+        data = data[:len(data) - len(data) % record_size]
+    return data, (stat.st_ino, offset + len(data))
@@ -0,0 +1,215 @@
+"""
+Normalized per-order line-item log
+"""
+
+import ast
+import csv
+import os
+import struct
+
+from metrics import metrics
+from sales_history import read_appended
+
+class LineItemLog:
+    """One record per sold line: order_id, product_id, quantity, unit_price,
+    subtotal.
+
+    The default format is a plain CSV. With ``binary=True`` records are
+    fixed-width little-endian structs (80 bytes each), which can be read
+    back with ``struct.iter_unpack`` without any text parsing.
+    """
+
+    fields = ['order_id', 'product_id', 'quantity', 'unit_price', 'subtotal']
+    record = struct.Struct('<32s24sqdd')
+
+    def __init__(self, filename=None, binary=False):
+        if filename is None:
+            filename = 'sales_line_items.bin' if binary else 'sales_line_items.csv'
+        self.filename = filename
+        self.binary = binary
+
+    def append(self, line_items):
+        if self.binary:
+            data = b''.join(self.pack(item) for item in line_items)
+            with open(self.filename, mode='ab') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            metrics.record_io(self.filename, bytes_written=len(data),
+                              rows_written=len(data) // self.record.size)
+            return
+
+        file_exists = os.path.exists(self.filename)
+        with open(self.filename, mode='a', newline='') as file:
+            start = file.tell()
+            writer = csv.DictWriter(file, fieldnames=self.fields, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(line_items)
+            file.flush()
+            os.fsync(file.fileno())
+            if metrics.enabled:
+                metrics.record_io(self.filename, bytes_written=file.tell() - start,
+                                  rows_written=len(line_items))
+
+    def pack(self, item):
+        order_id = str(item['order_id']).encode('utf-8')
+        product_id = str(item['product_id']).encode('utf-8')
+        if len(order_id) > 32 or len(product_id) > 24:
+            raise ValueError(f"Order or product id too long for binary line item: {item}")
+        return self.record.pack(order_id, product_id, item['quantity'],
+                                item['unit_price'], item['subtotal'])
+
+    def iter_items(self):
+        if not os.path.exists(self.filename):
+            return
+        if self.binary:
+            with open(self.filename, mode='rb') as file:
+                chunk_size = self.record.size * 4096
+                while True:
+                    chunk = file.read(chunk_size)
+                    if len(chunk) < self.record.size:
+                        break
+                    chunk = chunk[:len(chunk) - len(chunk) % self.record.size]
+                    for order_id, product_id, quantity, unit_price, subtotal in \
+                            self.record.iter_unpack(chunk):
+                        yield {
+                            'order_id': order_id.rstrip(b'\0').decode('utf-8'),
+                            'product_id': product_id.rstrip(b'\0').decode('utf-8'),
+                            'quantity': quantity,
+                            'unit_price': unit_price,
+                            'subtotal': subtotal
+                        }
+            return
+
+        with open(self.filename, mode='r', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for order_id, product_id, quantity, unit_price, subtotal in reader:
+                yield {
+                    'order_id': order_id,
+                    'product_id': product_id,
+                    'quantity': int(quantity),
+                    'unit_price': float(unit_price),
+                    'subtotal': float(subtotal)
+                }
+
+    def read_new(self, position=None):
+        """Line items appended since ``position`` as ``(order_id, product_id,
+        quantity, unit_price, subtotal)`` tuples, and the position to pass
+        next time (see ``sales_history.read_appended``). CSV fields come back
+        as strings."""
+        if self.binary:
+            data, position = read_appended(self.filename, position, self.record.size)
+            rows = [(order_id.rstrip(b'\0').decode('utf-8'),
+                     product_id.rstrip(b'\0').decode('utf-8'), quantity, unit_price, subtotal)
+                    for order_id, product_id, quantity, unit_price, subtotal
+                    in self.record.iter_unpack(data)]
+        else:
+            data, position = read_appended(self.filename, position)
+            rows = [tuple(row) for row in csv.reader(data.decode('utf-8').splitlines())
+                    if len(row) == 5]
+        metrics.record_io(self.filename, bytes_read=len(data), rows_read=len(rows))
+        return rows, position
+
+def has_legacy_details(sales_file):
+    if not os.path.exists(sales_file):
+        return False
+    with open(sales_file, mode='r', newline='') as file:
+        return 'details' in next(csv.reader(file), [])
+
+def legacy_line_items(row, ids_by_name):
+    """Line items for one legacy sales row; raises ValueError (or what
+    ``ast.literal_eval`` raises) if its ``details`` cannot be read."""
+    line_items = []
+    for name, quantity, subtotal in ast.literal_eval(row['details'] or '[]'):
+        if (not isinstance(name, str) or not isinstance(quantity, int) or
+                not isinstance(subtotal, (int, float))):
+            raise ValueError(f"malformed details for order {row['order_id']}")
+        line_items.append({
+            'order_id': row['order_id'],
+            'product_id': ids_by_name.get(name, ''),
+            'quantity': quantity,
+            'unit_price': subtotal / quantity if quantity else 0.0,
+            'subtotal': subtotal
+        })
+    return line_items
+
+def convert_sales_records(sales_file, line_item_log, ids_by_name=None):
+    """One-time conversion of a ``sales_records.csv`` that still carries the
+    stringified ``details`` column.
+
+    Each ``details`` list is parsed once and written to ``line_item_log``.
+    The old format never recorded product ids, so they are recovered from
+    ``ids_by_name`` (product name -> product id) where possible and left
+    blank otherwise. An order whose ``details`` cannot be parsed keeps its
+    sales row but gets no line items. The sales file is then rewritten
+    without the column.
+
+    The line item log's size before the conversion is kept in
+    ``<sales_file>.converting`` until the sales file is replaced, so a rerun
+    after a crash first drops the items the interrupted run appended.
+    Returns ``{'line_items': ..., 'skipped_orders': ...}``.
+    """
+    counts = {'line_items': 0, 'skipped_orders': 0}
+    marker_filename = sales_file + '.converting'
+    if not has_legacy_details(sales_file):
+        if os.path.exists(marker_filename):
+            os.remove(marker_filename)
+        return counts
+
+    if os.path.exists(marker_filename):
+        with open(marker_filename) as marker:
+            size = marker.read().strip()
+        if not size:
+            if os.path.exists(line_item_log.filename):
+                os.remove(line_item_log.filename)
+        elif os.path.exists(line_item_log.filename):
+            os.truncate(line_item_log.filename, int(size))
+    else:
+        size = (str(os.path.getsize(line_item_log.filename))
+                if os.path.exists(line_item_log.filename) else '')
+        with open(marker_filename, mode='w') as marker:
+            marker.write(size)
+            marker.flush()
+            os.fsync(marker.fileno())
+
+    ids_by_name = ids_by_name or {}
+    temp_filename = sales_file + '.tmp'
+    with open(sales_file, mode='r', newline='') as source, \
+            open(temp_filename, mode='w', newline='') as target:
+        writer = csv.DictWriter(target, fieldnames=['order_id', 'datetime', 'items', 'total'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        line_items = []
+        for row in csv.DictReader(source):
+            try:
+                line_items.extend(legacy_line_items(row, ids_by_name))
+            except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                counts['skipped_orders'] += 1
+            writer.writerow(row)
+            if len(line_items) >= 10000:
+                line_item_log.append(line_items)
+                counts['line_items'] += len(line_items)
+                line_items = []
+        line_item_log.append(line_items)
+        counts['line_items'] += len(line_items)
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(temp_filename, sales_file)
+    os.remove(marker_filename)
+
+    # The sparse offset index describes the old byte layout.
+    index_filename = sales_file + '.idx'
+    if os.path.exists(index_filename):
+        os.remove(index_filename)
+    return counts
+
+if __name__ == "__main__":
+    from inventory_backend import InventoryManager
+    ids_by_name = {}
+    for product in InventoryManager().products:
+        ids_by_name.setdefault(product.name, product.product_id)
+    counts = convert_sales_records('sales_records.csv', LineItemLog(), ids_by_name)
+    print(f"Converted {counts['line_items']} line items; skipped {counts['skipped_orders']} "
+          f"orders with unreadable details.")
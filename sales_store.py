@@ -0,0 +1,154 @@
+"""
+Day-partitioned sales store with running per-day totals
+"""
+
+import csv
+from datetime import timedelta
+import os
+
+from metrics import metrics
+from sales_history import SalesHistoryReader
+
+class SalesStore:
+    """Orders stored as one CSV per day, grouped into one directory per month.
+
+    Each month directory also holds ``totals.csv`` with the running order
+    count, item count and revenue for every day of that month. A daily report
+    is therefore one dictionary lookup, and a date-range report only reads the
+    totals of the months it spans.
+    """
+
+    order_fields = ['order_id', 'datetime', 'items', 'total']
+    totals_fields = ['date', 'num_orders', 'total_items', 'total_sales']
+
+    def __init__(self, directory='data/sales'):
+        self.directory = directory
+        self.month_totals = {}
+        self.month_stamps = {}
+
+    def month_dir(self, day):
+        return os.path.join(self.directory, day.strftime('%Y-%m'))
+
+    def day_file(self, day):
+        return os.path.join(self.month_dir(day), f"{day.isoformat()}.csv")
+
+    def day_stamp(self, day):
+        """Changes whenever an order is added to ``day`` (by any process)."""
+        try:
+            stat = os.stat(self.day_file(day))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def totals_stamp(self, filename):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load_month(self, day):
+        # Another process may have rewritten totals.csv since it was cached.
+        key = day.strftime('%Y-%m')
+        filename = os.path.join(self.month_dir(day), 'totals.csv')
+        stamp = self.totals_stamp(filename)
+        totals = self.month_totals.get(key)
+        if totals is not None and self.month_stamps.get(key) == stamp:
+            return totals
+
+        totals = {}
+        if stamp is not None:
+            with open(filename, mode='r', newline='') as file:
+                for row in csv.DictReader(file):
+                    totals[row['date']] = [
+                        int(row['num_orders']),
+                        int(row['total_items']),
+                        float(row['total_sales'])
+                    ]
+            metrics.record_io(filename, bytes_read=stamp[1], rows_read=len(totals))
+        self.month_totals[key] = totals
+        self.month_stamps[key] = stamp
+        return totals
+
+    def save_month(self, day):
+        key = day.strftime('%Y-%m')
+        totals = self.month_totals[key]
+        filename = os.path.join(self.month_dir(day), 'totals.csv')
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.totals_fields)
+            for date_key in sorted(totals):
+                writer.writerow([date_key] + totals[date_key])
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+        self.month_stamps[key] = self.totals_stamp(filename)
+        metrics.record_io(filename, bytes_written=self.month_stamps[key][1],
+                          rows_written=len(totals))
+
+    def add_sales(self, sale_records):
+        by_day = {}
+        for sale_record in sale_records:
+            by_day.setdefault(sale_record['datetime'].date(), []).append(sale_record)
+
+        # totals.csv first: a day's stamp is its day file, so a reader that
+        # sees the new stamp is guaranteed to read the new totals.
+        touched_months = {}
+        for day, records in by_day.items():
+            day_totals = self.load_month(day).setdefault(day.isoformat(), [0, 0, 0.0])
+            for sale_record in records:
+                day_totals[0] += 1
+                day_totals[1] += sale_record['items']
+                day_totals[2] += sale_record['total']
+            touched_months[day.strftime('%Y-%m')] = day
+        for day in touched_months.values():
+            os.makedirs(self.month_dir(day), exist_ok=True)
+            self.save_month(day)
+
+        for day, records in by_day.items():
+            filename = self.day_file(day)
+            file_exists = os.path.exists(filename)
+            with open(filename, mode='a', newline='') as file:
+                start = file.tell()
+                writer = csv.DictWriter(file, fieldnames=self.order_fields,
+                                        extrasaction='ignore')
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerows(records)
+                file.flush()
+                os.fsync(file.fileno())
+                if metrics.enabled:
+                    metrics.record_io(filename, bytes_written=file.tell() - start,
+                                      rows_written=len(records))
+
+    def get_day_totals(self, day):
+        num_orders, total_items, total_sales = self.load_month(day).get(
+            day.isoformat(), (0, 0, 0.0))
+        return {
+            'date': day,
+            'total_sales': total_sales,
+            'total_items': total_items,
+            'num_orders': num_orders
+        }
+
+    def get_range_totals(self, start_date, end_date):
+        days = []
+        day = start_date
+        while day <= end_date:
+            days.append(self.get_day_totals(day))
+            day += timedelta(days=1)
+        return days
+
+    def rebuild_from(self, sales_file):
+        """Seed the store from an existing ``sales_records.csv``."""
+        count = 0
+        records = []
+        for sale_record in SalesHistoryReader(sales_file).iter_sales():
+            records.append(sale_record)
+            if len(records) >= 10000:
+                self.add_sales(records)
+                count += len(records)
+                records = []
+        self.add_sales(records)
+        return count + len(records)
@@ -0,0 +1,297 @@
+"""
+Per-product sales velocity and reorder forecasting
+"""
+
+import csv
+from datetime import datetime
+import heapq
+import io
+import math
+import os
+import time
+
+from inventory_storage import FileLock
+from metrics import metrics, timed
+
+class SalesVelocity:
+    """Exponentially weighted units sold per day for every product, updated
+    as orders complete, with days of cover and projected stock-out dates.
+
+    Each sale adds ``units / tau`` to the product's rate, and rates decay by
+    ``exp(-days / tau)`` between sales (``tau`` follows from ``half_life``
+    in days), so a steady seller converges to its true units per day. A
+    rate is kept as one number, ``log_weight = log(rate) + t / tau``, which
+    only changes when the product sells.
+
+    Every rate decays by the same factor, so ranking products by days of
+    cover (stock / rate) does not change as time passes, only when a
+    product sells or its stock changes. The ranking is kept in a heap keyed
+    by ``log(stock) - log_weight`` and brought up to date from sales and
+    from the inventory's change listener; ``reorder_suggestions(k)`` pops
+    the first ``k`` without touching the sales history. The heap is built
+    on the first call.
+
+    State is saved as one row per product in ``filename`` plus an
+    append-only journal of sales since (``filename.journal``), shared by
+    processes through ``filename.lock`` the way ``CSVStorage`` shares the
+    inventory journal. Journal appends are not fsynced: a crash can lose
+    the last few velocity updates, never any sales.
+    """
+
+    prune_below = 1e-4
+
+    def __init__(self, inventory_manager, filename=None, half_life=7.0, max_entries=1000):
+        self.inventory = inventory_manager
+        self.filename = filename or inventory_manager.storage.velocity_file
+        self.journal_filename = self.filename + '.journal'
+        self.lock = FileLock(self.filename + '.lock')
+        self.tau = half_life / math.log(2)
+        self.max_entries = max_entries
+        self.log_weights = {}
+        self.heap = None
+        self.heap_seqs = {}
+        self.next_seq = 0
+        self.journal_offset = 0
+        self.journal_entries = 0
+        self.snapshot_stamp = None
+        storage = inventory_manager.storage
+        if not os.path.exists(self.filename) and not os.path.exists(self.journal_filename):
+            # Seeding reads the line-item log, which a legacy sales file
+            # only gets once converted.
+            storage.prepare_sales((product.product_id, product.name)
+                                  for product in inventory_manager.products)
+        with self.lock:
+            if not os.path.exists(self.filename) and not os.path.exists(self.journal_filename):
+                self.rebuild_from(storage)
+            self.load()
+        inventory_manager.add_change_listener(self.stock_changed)
+
+    def current_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        self.log_weights = {}
+        self.snapshot_stamp = self.current_stamp()
+        if self.snapshot_stamp is not None:
+            offsets = {}
+            with open(self.filename, mode='r', newline='') as file:
+                reader = csv.reader(file)
+                next(reader, None)
+                for product_id, units_per_day, as_of in reader:
+                    # Every row of one save shares its as_of.
+                    offset = offsets.get(as_of)
+                    if offset is None:
+                        offset = offsets[as_of] = (
+                            datetime.fromisoformat(as_of).timestamp() / 86400 / self.tau)
+                    self.log_weights[product_id] = math.log(float(units_per_day)) + offset
+            metrics.record_io(self.filename, bytes_read=self.snapshot_stamp[2],
+                              rows_read=len(self.log_weights))
+        self.journal_offset = self.journal_entries = 0
+        self.read_journal()
+        self.heap = None
+
+    def read_journal(self):
+        # Applies what this and other processes appended since the last read.
+        try:
+            with open(self.journal_filename, mode='rb') as file:
+                file.seek(self.journal_offset)
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        data = data[:data.rfind(b'\n') + 1]
+        self.journal_offset += len(data)
+        sold = []
+        for row in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+            try:
+                product_id, units, when = row[0], int(row[1]), float(row[2])
+            except (ValueError, IndexError):
+                continue
+            self.add_units(product_id, units, when / 86400)
+            sold.append(product_id)
+        self.journal_entries += len(sold)
+        metrics.record_io(self.journal_filename, bytes_read=len(data), rows_read=len(sold))
+        return sold
+
+    def add_units(self, product_id, units, day):
+        if units <= 0:
+            return
+        weight = math.log(units / self.tau) + day / self.tau
+        old = self.log_weights.get(product_id)
+        if old is not None:
+            high, low = max(old, weight), min(old, weight)
+            weight = high + math.log1p(math.exp(low - high))
+        self.log_weights[product_id] = weight
+
+    @timed('velocity.record_sales')
+    def record_sales(self, sale_records):
+        """Add the line items of completed orders: one journal append, then
+        O(line items) updates (plus whatever other processes appended)."""
+        rows = [(item['product_id'], item['quantity'], sale_record['datetime'].timestamp())
+                for sale_record in sale_records for item in sale_record['line_items']]
+        if not rows:
+            return
+        with self.lock:
+            self.sync()
+            with open(self.journal_filename, mode='a', newline='') as file:
+                start = file.tell()
+                csv.writer(file).writerows(rows)
+                end = file.tell()
+            metrics.record_io(self.journal_filename, bytes_written=end - start,
+                              rows_written=len(rows))
+            for product_id in self.read_journal():
+                self.push(product_id)
+            self.trim_heap()
+            if self.journal_entries >= self.max_entries:
+                self.save()
+
+    def sync(self):
+        # Call with the lock held: reload if another process saved a new
+        # snapshot, otherwise apply its journal appends.
+        try:
+            journal_size = os.path.getsize(self.journal_filename)
+        except FileNotFoundError:
+            journal_size = 0
+        if self.current_stamp() != self.snapshot_stamp or journal_size < self.journal_offset:
+            self.load()
+            return
+        for product_id in self.read_journal():
+            self.push(product_id)
+
+    @timed('velocity.save')
+    def save(self):
+        """Write the current rates as one row per product and clear the
+        journal. Products whose rate has decayed to almost nothing are
+        dropped."""
+        with self.lock:
+            self.sync()
+            if not self.log_weights and self.snapshot_stamp is None:
+                # Nothing sold yet: writing an empty file would stop the
+                # next start from seeding from the sales history.
+                return
+            now = time.time()
+            as_of = datetime.fromtimestamp(now).isoformat(sep=' ')
+            today = now / 86400
+            temp_filename = f"{self.filename}.{os.getpid()}.tmp"
+            with open(temp_filename, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['product_id', 'units_per_day', 'as_of'])
+                for product_id, log_weight in list(self.log_weights.items()):
+                    rate = math.exp(log_weight - today / self.tau)
+                    if rate < self.prune_below:
+                        del self.log_weights[product_id]
+                        self.heap_seqs.pop(product_id, None)
+                        continue
+                    writer.writerow([product_id, rate, as_of])
+                written = file.tell()
+            os.replace(temp_filename, self.filename)
+            if os.path.exists(self.journal_filename):
+                os.remove(self.journal_filename)
+            self.snapshot_stamp = self.current_stamp()
+            self.journal_offset = self.journal_entries = 0
+        metrics.record_io(self.filename, bytes_written=written, rows_written=len(self.log_weights))
+
+    def rebuild_from(self, storage):
+        """One-time seeding from the recorded sales history, for stores that
+        already have sales when velocity tracking starts."""
+        items, _ = storage.read_new_line_items(None)
+        if not items:
+            return
+        orders, _ = storage.read_new_sales(None)
+        order_days = {order_id: datetime.fromisoformat(str(order_time)).timestamp() / 86400
+                      for order_id, order_time, _, _ in orders}
+        for order_id, product_id, quantity, _, _ in items:
+            day = order_days.get(order_id)
+            if day is not None:
+                self.add_units(product_id, int(quantity), day)
+        self.save()
+
+    def rate(self, product_id, now=None):
+        """Units per day, as of ``now`` (a timestamp, default the present)."""
+        log_weight = self.log_weights.get(product_id)
+        if log_weight is None:
+            return 0.0
+        today = (now if now is not None else time.time()) / 86400
+        return math.exp(log_weight - today / self.tau)
+
+    def cover_key(self, product_id, quantity):
+        if quantity <= 0:
+            return -math.inf
+        return math.log(quantity) - self.log_weights[product_id]
+
+    def push(self, product_id):
+        if self.heap is None:
+            return
+        product = self.inventory.get_product(product_id)
+        if product is None or product_id not in self.log_weights:
+            self.heap_seqs.pop(product_id, None)
+            return
+        self.next_seq += 1
+        self.heap_seqs[product_id] = self.next_seq
+        heapq.heappush(self.heap, (self.cover_key(product_id, product.quantity),
+                                   self.next_seq, product_id))
+
+    def trim_heap(self):
+        # Superseded entries are skipped when popped; rebuild once they
+        # outnumber the live ones.
+        if self.heap is not None and len(self.heap) > 2 * len(self.heap_seqs) + 64:
+            self.rebuild_heap()
+
+    def rebuild_heap(self):
+        self.heap, self.heap_seqs = [], {}
+        catalog = self.inventory.products
+        log = math.log
+        for product_id, log_weight in self.log_weights.items():
+            row = catalog.rows.get(product_id)
+            if row is not None:
+                quantity = catalog.quantities[row]
+                self.next_seq += 1
+                self.heap_seqs[product_id] = self.next_seq
+                self.heap.append((log(quantity) - log_weight if quantity > 0 else -math.inf,
+                                  self.next_seq, product_id))
+        heapq.heapify(self.heap)
+
+    def stock_changed(self, product_ids):
+        if product_ids is None:
+            self.heap = None
+            return
+        for product_id in product_ids:
+            if product_id in self.log_weights:
+                self.push(product_id)
+        self.trim_heap()
+
+    @timed('velocity.reorder_suggestions')
+    def reorder_suggestions(self, limit=10, now=None):
+        """The ``limit`` products that will run out first at their current
+        rate of sale, soonest first, as ``(product, units_per_day,
+        days_of_cover)``; out-of-stock products come first with 0 days.
+        Products that have never sold are not included."""
+        with self.lock:
+            self.sync()
+        if self.heap is None:
+            self.rebuild_heap()
+        now = now if now is not None else time.time()
+        found = []
+        while self.heap and len(found) < limit:
+            entry = heapq.heappop(self.heap)
+            key, seq, product_id = entry
+            if self.heap_seqs.get(product_id) != seq:
+                continue
+            product = self.inventory.get_product(product_id)
+            if product is None:
+                del self.heap_seqs[product_id]
+                continue
+            if key != self.cover_key(product_id, product.quantity):
+                self.push(product_id)
+                continue
+            found.append((entry, product))
+        suggestions = []
+        for entry, product in found:
+            heapq.heappush(self.heap, entry)
+            rate = self.rate(product.product_id, now)
+            cover = product.quantity / rate if product.quantity > 0 else 0.0
+            suggestions.append((product, rate, cover))
+        return suggestions
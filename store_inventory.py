@@ -0,0 +1,211 @@
+"""
+Sharded inventory: one catalog per store, with cross-store stock queries
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+
+from inventory_backend import InventoryManager, OrderManager
+from inventory_storage import CSVStorage, SQLiteStorage
+from metrics import timed
+from sales_line_items import LineItemLog
+from sales_store import SalesStore
+
+STORES_DIRECTORY = os.path.join('data', 'stores')
+
+def store_directory(store_id, directory=STORES_DIRECTORY):
+    """``directory/<store_id>``; the id must be a plain directory name."""
+    if (not store_id or store_id in ('.', '..') or os.sep in store_id or
+            (os.altsep and os.altsep in store_id) or os.path.isabs(store_id)):
+        raise ValueError(f"invalid store id {store_id!r}")
+    return os.path.join(directory, store_id)
+
+def store_storage(directory, storage='csv'):
+    """Storage for one store, with every file (catalog, journal, sales,
+    line items, caches) under ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    if storage == 'sqlite':
+        return SQLiteStorage(os.path.join(directory, 'inventory.db'))
+    return CSVStorage(os.path.join(directory, 'inventory.csv'), journal=True,
+                      sales_file=os.path.join(directory, 'sales_records.csv'),
+                      sales_store=SalesStore(os.path.join(directory, 'sales')),
+                      line_item_log=LineItemLog(os.path.join(directory, 'sales_line_items.csv')))
+
+def warm_snapshot_cache(directory):
+    """Parse one store's inventory.csv and write its snapshot cache; runs in
+    worker processes."""
+    return len(InventoryManager(storage=store_storage(directory)).products)
+
+class ShardedInventory:
+    """One ``InventoryManager`` shard per store, each in its own directory
+    under ``directory`` (``data/stores/<store id>/``), so every store keeps
+    its own catalog, journal, lock and sales history.
+
+    Shards are loaded in parallel: with CSV storage, stores whose snapshot
+    cache is out of date are parsed in ``workers`` processes (which write
+    the cache), then every shard is loaded from its cache in a thread pool.
+    SQLite connections belong to the thread that opens them, so SQLite
+    shards load one after another.
+
+    Cross-store queries look each product up in every shard's id and stock
+    indexes; no combined catalog is built.
+    """
+
+    def __init__(self, directory=STORES_DIRECTORY, storage='csv', workers=None):
+        self.directory = directory
+        self.storage = storage
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.shards = {}
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def store_ids(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def store_directory(self, store_id):
+        return store_directory(store_id, self.directory)
+
+    @timed('stores.load')
+    def load(self):
+        store_ids = self.store_ids()
+        if self.storage == 'sqlite':
+            self.shards = {store_id: self.load_shard(store_id) for store_id in store_ids}
+            return
+
+        stale = [self.store_directory(store_id) for store_id in store_ids
+                 if store_storage(self.store_directory(store_id)).cache_is_stale()]
+        if len(stale) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(min(self.workers, len(stale))) as executor:
+                list(executor.map(warm_snapshot_cache, stale))
+        with ThreadPoolExecutor(self.workers) as executor:
+            self.shards = dict(zip(store_ids, executor.map(self.load_shard, store_ids)))
+
+    def load_shard(self, store_id):
+        return InventoryManager(storage=store_storage(self.store_directory(store_id),
+                                                      self.storage))
+
+    def add_store(self, store_id):
+        """Create an empty store (or return the existing one's shard)."""
+        if store_id not in self.shards:
+            self.store_directory(store_id)
+            self.shards[store_id] = self.load_shard(store_id)
+        return self.shards[store_id]
+
+    def shard(self, store_id):
+        try:
+            return self.shards[store_id]
+        except KeyError:
+            raise KeyError(f"unknown store {store_id!r}") from None
+
+    def order_manager(self, store_id, **kwargs):
+        """An ``OrderManager`` that sells from, and records sales in,
+        ``store_id``'s shard."""
+        return OrderManager(self.shard(store_id), **kwargs)
+
+    def refresh(self):
+        """Pick up changes other processes made to any store."""
+        for inventory_manager in self.shards.values():
+            with inventory_manager.storage.transaction():
+                inventory_manager.refresh()
+
+    @timed('stores.stock_by_store')
+    def stock_by_store(self, product_id):
+        """``{store_id: quantity}`` for every store that carries the product."""
+        stock = {}
+        for store_id, inventory_manager in self.shards.items():
+            product = inventory_manager.get_product(product_id)
+            if product is not None:
+                stock[store_id] = product.quantity
+        return stock
+
+    def total_stock(self, product_id):
+        return sum(self.stock_by_store(product_id).values())
+
+    def where_in_stock(self, product_id, quantity=1):
+        """``(store_id, product)`` for each store with at least ``quantity``
+        units, most stock first."""
+        found = []
+        for store_id, inventory_manager in self.shards.items():
+            product = inventory_manager.get_product(product_id)
+            if product is not None and product.quantity >= quantity:
+                found.append((store_id, product))
+        found.sort(key=lambda entry: entry[1].quantity, reverse=True)
+        return found
+
+    def iter_low_stock(self, threshold=5):
+        """Yield ``(store_id, product)`` for products at or below
+        ``threshold`` in each store, store by store."""
+        for store_id, inventory_manager in self.shards.items():
+            for product in inventory_manager.get_low_stock_products(threshold):
+                yield store_id, product
+
+    @timed('stores.network_low_stock')
+    def network_low_stock(self, threshold=5):
+        """Products whose stock summed over every store that carries them is
+        at or below ``threshold``, as ``(product_id, total, {store_id:
+        quantity})``, lowest total first.
+
+        Stock can be negative (an oversold or hand-corrected product), so a
+        product's other stores can bring its total down as well as up. Still,
+        with a threshold of zero or more, a total at or below the threshold
+        needs at least one store at or below it, so only products in some
+        store's low stock entries are candidates; each is then summed over
+        every store. A negative threshold checks the whole catalogs."""
+        if threshold >= 0:
+            candidates = {product.product_id for _, product in self.iter_low_stock(threshold)}
+        else:
+            candidates = {product_id for inventory_manager in self.shards.values()
+                          for product_id in inventory_manager.products.rows}
+        found = []
+        for product_id in candidates:
+            stock = {}
+            for store_id, inventory_manager in self.shards.items():
+                product = inventory_manager.get_product(product_id)
+                if product is not None:
+                    stock[store_id] = product.quantity
+            total = sum(stock.values())
+            if total <= threshold:
+                found.append((product_id, total, stock))
+        found.sort(key=lambda entry: (entry[1], entry[0]))
+        return found
+
+    def product_counts(self):
+        return {store_id: len(inventory_manager.products)
+                for store_id, inventory_manager in self.shards.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Stock queries across every store")
+    parser.add_argument('--directory', default=STORES_DIRECTORY,
+                        help="one subdirectory per store (default: data/stores)")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--workers', type=int, help="parallel shard loads (default: CPUs, max 8)")
+    parser.add_argument('--where', metavar='PRODUCT_ID',
+                        help="list the stores that have this product in stock")
+    parser.add_argument('--low-stock', type=int, metavar='THRESHOLD',
+                        help="products at or below THRESHOLD units across all stores")
+    args = parser.parse_args()
+
+    stores = ShardedInventory(args.directory, args.storage, args.workers)
+    counts = stores.product_counts()
+    print(f"{len(counts)} stores, {sum(counts.values())} catalog entries")
+
+    if args.where:
+        found = stores.where_in_stock(args.where)
+        if not found:
+            print(f"{args.where} is not in stock at any store.")
+        for store_id, product in found:
+            print(f"{store_id}\t{product.name[:15]}\t{product.quantity}")
+        if found:
+            print(f"Total: {sum(product.quantity for _, product in found)}")
+
+    if args.low_stock is not None:
+        low = stores.network_low_stock(args.low_stock)
+        print(f"{len(low)} products with {args.low_stock} units or fewer across all stores")
+        for product_id, total, stock in low:
+            by_store = ', '.join(f"{store_id}: {quantity}" for store_id, quantity in stock.items())
+            print(f"{product_id}\t{total}\t{by_store}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Storages under a temporary directory, shared by the test modules
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory_storage import CSVStorage, SQLiteStorage
+from sales_line_items import LineItemLog
+from sales_store import SalesStore
+
+def csv_storage(directory, **kwargs):
+    return CSVStorage(os.path.join(directory, 'inventory.csv'), journal=True,
+                      sales_file=os.path.join(directory, 'sales_records.csv'),
+                      sales_store=SalesStore(os.path.join(directory, 'sales')),
+                      line_item_log=LineItemLog(os.path.join(directory, 'sales_line_items.csv')),
+                      **kwargs)
+
+def sqlite_storage(directory):
+    return SQLiteStorage(os.path.join(directory, 'inventory.db'))
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage
+from inventory_backend import InventoryManager
+
+class BatchTest(unittest.TestCase):
+    """A batch is written once; a failure rolls back exactly what its own
+    scope changed."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = InventoryManager(storage=csv_storage(self.directory))
+        self.manager.add_product('P1', 'Fan', 10.0, 5)
+        self.manager.add_product('P2', 'Lamp', 20.0, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def catalog(self, manager=None):
+        return sorted((manager or self.manager).products.iter_rows())
+
+    def reloaded(self):
+        return self.catalog(InventoryManager(storage=csv_storage(self.directory)))
+
+    def test_failed_nested_batch_is_undone_alone(self):
+        with self.manager.batch():
+            self.manager.update_product('P1', quantity=4)
+            with self.assertRaises(ValueError):
+                with self.manager.batch():
+                    self.manager.update_product('P2', price=25.0)
+                    self.manager.delete_product('P1')
+                    self.manager.add_product('P3', 'Desk', 99.0, 1)
+                    raise ValueError("bad row")
+            self.manager.add_product('P4', 'Chair', 49.0, 2)
+
+        expected = [('P1', 'Fan', 10.0, 4), ('P2', 'Lamp', 20.0, 3), ('P4', 'Chair', 49.0, 2)]
+        self.assertEqual(self.catalog(), expected)
+        self.assertEqual(self.reloaded(), expected)
+        # The indexes were rolled back with the rows.
+        self.assertEqual([product.product_id for product in
+                          self.manager.get_low_stock_products(4)], ['P1', 'P2', 'P4'])
+        self.assertEqual(self.manager.search_product(name='Desk'), [])
+
+    def test_failed_outer_batch_writes_nothing(self):
+        before = self.catalog()
+        with open(os.path.join(self.directory, 'inventory.csv.journal'), 'rb') as file:
+            journal = file.read()
+        with self.assertRaises(KeyError):
+            with self.manager.batch():
+                self.manager.update_product('P1', quantity=0)
+                with self.manager.batch():
+                    self.manager.delete_product('P2')
+                raise KeyError('P9')
+
+        self.assertEqual(self.catalog(), before)
+        self.assertEqual(self.reloaded(), before)
+        with open(os.path.join(self.directory, 'inventory.csv.journal'), 'rb') as file:
+            self.assertEqual(file.read(), journal)
+        self.assertEqual(self.manager.get_low_stock_products(0), [])
+
+    def test_batch_is_written_once(self):
+        writes = []
+        write_changes = self.manager.storage.write_changes
+        def counting_write_changes(changes, catalog):
+            writes.append(len(changes))
+            write_changes(changes, catalog)
+        self.manager.storage.write_changes = counting_write_changes
+
+        with self.manager.batch():
+            for number in range(50):
+                self.manager.add_product(f"N{number}", 'Bulb', 1.0, number)
+            self.manager.update_product('N0', quantity=100)
+        self.assertEqual(writes, [50])
+
+    def test_invalid_import_row_rolls_back_import(self):
+        before = self.catalog()
+        rows = [{'product_id': 'P1', 'price': '11.0'},
+                {'product_id': 'P5', 'name': 'Rug', 'price': '30', 'quantity': '2'},
+                {'product_id': 'P6', 'name': 'Mat', 'price': 'cheap', 'quantity': '1'}]
+        with self.assertRaises(ValueError):
+            self.manager.import_products(rows)
+        self.assertEqual(self.catalog(), before)
+        self.assertEqual(self.reloaded(), before)
+
+        self.assertEqual(self.manager.import_products(rows[:2]), (1, 1))
+        self.assertEqual(self.manager.get_product('P1').price, 11.0)
+
+if __name__ == '__main__':
+    unittest.main()
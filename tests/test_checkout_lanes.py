@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage, sqlite_storage
+from inventory_backend import InventoryManager, OrderManager
+
+STORAGES = {'csv': csv_storage, 'sqlite': sqlite_storage}
+
+def checkout_lane(directory, storage, attempts):
+    """Sell one P1 at a time from its own process; returns the orders that
+    went through."""
+    orders = OrderManager(InventoryManager(storage=STORAGES[storage](directory)))
+    sold = 0
+    for _ in range(attempts):
+        # The cart is checked against this lane's possibly stale copy; the
+        # checkout re-checks it against the store.
+        if orders.add_to_cart('P1', 1) and orders.process_order():
+            sold += 1
+        orders.cart.clear()
+    return sold
+
+class CheckoutLanesTest(unittest.TestCase):
+    """Lanes in separate processes never sell the same units twice."""
+
+    lanes = 4
+    attempts = 15
+    stock = 25
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_no_oversell(self, storage):
+        manager = InventoryManager(storage=STORAGES[storage](self.directory))
+        manager.add_product('P1', 'Fan', 2.0, self.stock)
+        manager.storage.close()
+
+        with ProcessPoolExecutor(self.lanes) as pool:
+            sold = sum(pool.map(checkout_lane, [self.directory] * self.lanes,
+                                [storage] * self.lanes, [self.attempts] * self.lanes))
+
+        self.assertEqual(sold, self.stock)
+        storage_after = STORAGES[storage](self.directory)
+        self.assertEqual(InventoryManager(storage=storage_after).get_product('P1').quantity, 0)
+        sales, _ = storage_after.read_new_sales(None)
+        self.assertEqual(len(sales), self.stock)
+
+    def test_no_oversell_csv(self):
+        self.check_no_oversell('csv')
+
+    def test_no_oversell_sqlite(self):
+        self.check_no_oversell('sqlite')
+
+if __name__ == '__main__':
+    unittest.main()
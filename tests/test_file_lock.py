@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory_storage import FileLock
+
+class FileLockThreadTest(unittest.TestCase):
+    """Threads sharing one FileLock take turns, and each keeps the lock
+    file open until its own outermost release."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.lock = FileLock(os.path.join(self.directory, 'inventory.csv.lock'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_threads_take_turns(self):
+        holders = []
+        overlaps = []
+
+        def hold():
+            for _ in range(20):
+                with self.lock:
+                    with self.lock:
+                        holders.append(threading.get_ident())
+                        if len(holders) > 1:
+                            overlaps.append(list(holders))
+                        time.sleep(0.001)
+                        self.assertIsNotNone(self.lock.file)
+                        holders.remove(threading.get_ident())
+
+        threads = [threading.Thread(target=hold) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(self.lock.depth, 0)
+        self.assertIsNone(self.lock.file)
+
+if __name__ == '__main__':
+    unittest.main()
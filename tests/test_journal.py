@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage
+from inventory_backend import InventoryManager
+
+class JournalTest(unittest.TestCase):
+    """Catalog changes are appended to the journal, replayed on load and
+    folded into inventory.csv by compaction."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.directory, 'inventory.csv')
+        self.journal = self.snapshot + '.journal'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def manager(self, **kwargs):
+        return InventoryManager(storage=csv_storage(self.directory, **kwargs))
+
+    def catalog(self, manager):
+        return sorted(manager.products.iter_rows())
+
+    def test_changes_are_journaled_and_replayed(self):
+        manager = self.manager()
+        manager.add_product('P1', 'Fan', 10.0, 5)
+        manager.add_product('P2', 'Lamp', 20.0, 3)
+        manager.update_product('P1', price=12.5, quantity=4)
+        manager.delete_product('P2')
+
+        self.assertFalse(os.path.exists(self.snapshot))
+        with open(self.journal) as file:
+            self.assertEqual(len(file.readlines()), 4)
+        reloaded = self.manager()
+        self.assertEqual(self.catalog(reloaded), [('P1', 'Fan', 12.5, 4)])
+        self.assertIsNone(reloaded.get_product('P2'))
+
+    def test_torn_tail_is_dropped(self):
+        manager = self.manager()
+        manager.add_product('P1', 'Fan', 10.0, 5)
+        with open(self.journal, 'a') as file:
+            file.write('upsert,P1,Fan,10.0,')
+
+        reloaded = self.manager()
+        self.assertEqual(self.catalog(reloaded), [('P1', 'Fan', 10.0, 5)])
+        reloaded.update_product('P1', quantity=7)
+        self.assertEqual(self.catalog(self.manager()), [('P1', 'Fan', 10.0, 7)])
+
+    def test_compaction_writes_snapshot_and_clears_journal(self):
+        manager = self.manager(journal_max_entries=3)
+        manager.add_product('P1', 'Fan', 10.0, 5)
+        manager.add_product('P2', 'Lamp', 20.0, 3)
+        self.assertFalse(os.path.exists(self.snapshot))
+        manager.update_product('P2', quantity=1)
+
+        self.assertTrue(os.path.exists(self.snapshot))
+        self.assertFalse(os.path.exists(self.journal))
+        self.assertEqual(self.catalog(self.manager()),
+                         [('P1', 'Fan', 10.0, 5), ('P2', 'Lamp', 20.0, 1)])
+
+        manager.delete_product('P1')
+        manager.compact()
+        self.assertFalse(os.path.exists(self.journal))
+        self.assertEqual(self.catalog(self.manager()), [('P2', 'Lamp', 20.0, 1)])
+
+    def test_other_process_changes_are_picked_up(self):
+        lane = self.manager()
+        other_lane = self.manager()
+        other_lane.add_product('P1', 'Fan', 10.0, 5)
+        with lane.storage.transaction():
+            lane.refresh()
+        self.assertEqual(lane.get_product('P1').quantity, 5)
+
+        # After a compaction the snapshot is new, so the lane reloads it.
+        other_lane.update_product('P1', quantity=2)
+        other_lane.compact()
+        with lane.storage.transaction():
+            lane.refresh()
+        self.assertEqual(self.catalog(lane), [('P1', 'Fan', 10.0, 2)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage
+from inventory_backend import InventoryManager
+
+class NameSearchTest(unittest.TestCase):
+    """The trigram index keeps matching the live names through renames,
+    deletes, rollbacks and other lanes' changes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = InventoryManager(storage=csv_storage(self.directory))
+        with self.manager.batch():
+            self.manager.add_product('P1', 'Ceiling Fan', 10.0, 5)
+            self.manager.add_product('P2', 'Desk Lamp', 20.0, 3)
+            self.manager.add_product('P3', 'Table fan', 15.0, 8)
+        # The first name search builds the index.
+        self.assertEqual(self.ids('fan'), ['P1', 'P3'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ids(self, name, product_id=None):
+        return [product.product_id for product in
+                self.manager.search_product(product_id=product_id, name=name)]
+
+    def test_rename(self):
+        self.manager.update_product('P1', name='Ceiling Light')
+        self.assertEqual(self.ids('fan'), ['P3'])
+        self.assertEqual(self.ids('LIGHT'), ['P1'])
+        self.manager.update_product('P1', name='Ceiling Fan')
+        self.assertEqual(self.ids('fan'), ['P1', 'P3'])
+
+    def test_delete_and_add(self):
+        self.manager.delete_product('P3')
+        self.assertEqual(self.ids('fan'), ['P1'])
+        self.manager.add_product('P4', 'Box Fan', 30.0, 2)
+        self.assertEqual(self.ids('fan'), ['P1', 'P4'])
+
+    def test_short_queries_and_id_match(self):
+        self.assertEqual(self.ids('fa'), ['P1', 'P3'])
+        self.assertEqual(self.ids('lamp', product_id='P1'), ['P1', 'P2'])
+
+    def test_rolled_back_rename(self):
+        with self.assertRaises(RuntimeError):
+            with self.manager.batch():
+                self.manager.update_product('P2', name='Floor Fan')
+                self.assertEqual(self.ids('fan'), ['P1', 'P2', 'P3'])
+                raise RuntimeError
+        self.assertEqual(self.ids('fan'), ['P1', 'P3'])
+        self.assertEqual(self.ids('lamp'), ['P2'])
+
+    def test_other_lane_changes(self):
+        other_lane = InventoryManager(storage=csv_storage(self.directory))
+        with other_lane.batch():
+            other_lane.update_product('P2', name='Desk Fan')
+            other_lane.delete_product('P1')
+        with self.manager.storage.transaction():
+            self.manager.refresh()
+        self.assertEqual(self.ids('fan'), ['P2', 'P3'])
+
+    def test_matches_plain_scan_after_random_changes(self):
+        words = ['fan', 'lamp', 'desk', 'Fancy', 'rug', 'Mat', 'ceiling', 'x']
+        generator = random.Random(7)
+        def random_name():
+            return ' '.join(generator.choice(words) for _ in range(generator.randint(1, 3)))
+        with self.manager.batch():
+            for number in range(200):
+                product_id = f"R{generator.randrange(60)}"
+                if generator.random() < 0.2:
+                    self.manager.delete_product(product_id)
+                elif self.manager.get_product(product_id) is None:
+                    self.manager.add_product(product_id, random_name(), 1.0, 1)
+                else:
+                    self.manager.update_product(product_id, name=random_name())
+        for query in words + ['an', 'ANC', 'p m', 'zzz']:
+            expected = [product.product_id for product in self.manager.products
+                        if query.lower() in product.name.lower()]
+            self.assertEqual(self.ids(query), expected, query)
+
+if __name__ == '__main__':
+    unittest.main()
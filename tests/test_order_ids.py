@@ -0,0 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_ids import OrderIdGenerator, generate_ids
+
+class OrderIdTest(unittest.TestCase):
+    """Order ids never collide across processes and threads, and sort in
+    time order."""
+
+    def test_no_collisions_across_processes(self):
+        processes, threads, count = 4, 3, 3000
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(generate_ids, [count] * processes, [threads] * processes))
+        all_ids = [order_id for ids in results for order_id in ids]
+        self.assertEqual(len(all_ids), processes * threads * count)
+        self.assertEqual(len(set(all_ids)), len(all_ids))
+        # Sorting the ids sorts them by their millisecond stamp.
+        stamps = [order_id.split('-')[0] for order_id in sorted(all_ids)]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_ids_sort_by_time(self):
+        generator = OrderIdGenerator(lane=1)
+        start = datetime(2025, 9, 30, 23, 59, 59)
+        times = [start + timedelta(milliseconds=step * 7) for step in range(500)]
+        ids = [generator.next_id(when) for when in times]
+        self.assertEqual(ids, sorted(ids))
+        # A later lane's id from an earlier millisecond still sorts first.
+        self.assertLess(OrderIdGenerator(lane=9999999).next_id(times[0]), ids[1])
+
+    def test_clock_stepping_back_stays_increasing(self):
+        generator = OrderIdGenerator(lane=1)
+        now = datetime(2025, 9, 30, 12, 0)
+        first = generator.next_id(now)
+        second = generator.next_id(now - timedelta(seconds=5))
+        self.assertLess(first, second)
+
+    def test_sequence_overflow_borrows_next_millisecond(self):
+        generator = OrderIdGenerator(lane=1)
+        now = datetime(2025, 9, 30, 12, 0)
+        ids = [generator.next_id(now) for _ in range(OrderIdGenerator.sequence_limit + 1)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(int(ids[-1].split('-')[0]) - int(ids[0].split('-')[0]), 1)
+        self.assertTrue(ids[-1].endswith('-0000'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage
+from inventory_backend import InventoryManager, OrderManager
+from report_cache import ReportCache
+from sales_store import SalesStore
+
+class DayStampTest(unittest.TestCase):
+    """A day's stamp only changes once its totals are saved."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SalesStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_totals_saved_before_stamp_changes(self):
+        sale_time = datetime(2025, 9, 30, 12, 0)
+        day = sale_time.date()
+        self.store.add_sales([{'order_id': '1', 'datetime': sale_time, 'items': 1, 'total': 5.0}])
+        stamp = self.store.day_stamp(day)
+
+        # What another process would see when the new totals land.
+        seen = []
+        save_month = self.store.save_month
+        def watch_save_month(month_day):
+            save_month(month_day)
+            reader = SalesStore(self.directory)
+            seen.append((reader.day_stamp(day), reader.get_day_totals(day)['num_orders']))
+        self.store.save_month = watch_save_month
+
+        self.store.add_sales([{'order_id': '2', 'datetime': sale_time, 'items': 2, 'total': 7.0}])
+        self.assertEqual(seen, [(stamp, 2)])
+        self.assertNotEqual(self.store.day_stamp(day), stamp)
+
+class ReconcileSalesTest(unittest.TestCase):
+    """Daily totals that drift from the sales history are reported."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = InventoryManager(storage=csv_storage(self.directory))
+        self.manager.add_product('P1', 'Fan', 10.0, 50)
+        self.order_manager = OrderManager(self.manager)
+        self.report_cache = ReportCache(self.manager)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def order(self):
+        self.order_manager.add_to_cart('P1', 2)
+        self.assertTrue(self.order_manager.process_order(0))
+        return self.order_manager.sales_records[-1]['datetime'].date()
+
+    def test_totals_match_history(self):
+        day = self.order()
+        self.order()
+        self.assertEqual(self.report_cache.reconcile_sales(self.order_manager, day), [])
+        self.assertEqual(self.order_manager.reconcile_sales(day - timedelta(days=7), day), [])
+
+    def test_drifted_totals_are_reported(self):
+        day = self.order()
+        self.assertEqual(self.report_cache.reconcile_sales(self.order_manager, day), [])
+        # Totals counting an order the history does not have.
+        sales_store = self.manager.storage.sales_store
+        sales_store.load_month(day)[day.isoformat()][0] += 1
+        sales_store.save_month(day)
+        self.order()
+        mismatches = self.report_cache.reconcile_sales(self.order_manager, day)
+        self.assertEqual(len(mismatches), 1)
+        self.assertEqual(mismatches[0]['stored']['num_orders'], 3)
+        self.assertEqual(mismatches[0]['recounted']['num_orders'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
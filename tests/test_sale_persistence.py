@@ -0,0 +1,149 @@
+from datetime import date
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage, sqlite_storage
+from inventory_backend import InventoryManager, OrderManager
+
+class SalePersistenceTest(unittest.TestCase):
+    """A sale is only recorded once its stock change is saved."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_manager(self, make_storage):
+        manager = InventoryManager(storage=make_storage(self.directory))
+        manager.add_product('P1', 'Fan', 10.0, 5)
+        return manager
+
+    def check_failed_stock_write(self, make_storage):
+        manager = self.make_manager(make_storage)
+        orders = OrderManager(manager)
+        self.assertTrue(orders.add_to_cart('P1', 2))
+
+        def write_changes(changes, catalog):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        manager.storage.write_changes = write_changes
+        with self.assertRaises(OSError):
+            orders.process_order()
+
+        self.assertEqual(manager.get_product('P1').quantity, 5)
+        storage = make_storage(self.directory)
+        sales, _ = storage.read_new_sales(None)
+        items, _ = storage.read_new_line_items(None)
+        self.assertEqual(sales, [])
+        self.assertEqual(items, [])
+        self.assertEqual(storage.get_day_totals(date.today())['num_orders'], 0)
+        self.assertEqual(InventoryManager(storage=storage).get_product('P1').quantity, 5)
+
+    def check_failed_sale_record(self, make_storage):
+        manager = self.make_manager(make_storage)
+        orders = OrderManager(manager)
+        self.assertTrue(orders.add_to_cart('P1', 2))
+
+        def record_sales(sale_records):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        manager.storage.record_sales = record_sales
+        with self.assertRaises(OSError):
+            orders.process_order()
+
+        # The stock taken for the order is put back, in memory and on disk.
+        self.assertEqual(manager.get_product('P1').quantity, 5)
+        storage = make_storage(self.directory)
+        self.assertEqual(InventoryManager(storage=storage).get_product('P1').quantity, 5)
+        self.assertEqual(storage.read_new_sales(None)[0], [])
+
+    def test_failed_stock_write_records_no_sale_csv(self):
+        self.check_failed_stock_write(csv_storage)
+
+    def test_failed_stock_write_records_no_sale_sqlite(self):
+        self.check_failed_stock_write(sqlite_storage)
+
+    def test_failed_sale_record_restores_stock_csv(self):
+        self.check_failed_sale_record(csv_storage)
+
+    def test_failed_sale_record_restores_stock_sqlite(self):
+        self.check_failed_sale_record(sqlite_storage)
+
+    def test_order_is_recorded(self):
+        manager = self.make_manager(csv_storage)
+        orders = OrderManager(manager)
+        self.assertTrue(orders.add_to_cart('P1', 2))
+        self.assertTrue(orders.process_order())
+        storage = csv_storage(self.directory)
+        self.assertEqual(len(storage.read_new_sales(None)[0]), 1)
+        self.assertEqual(InventoryManager(storage=storage).get_product('P1').quantity, 3)
+
+class CartRepricingTest(unittest.TestCase):
+    """A price changed in another lane after an item was added to the cart
+    is charged consistently."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_price_change_in_other_lane(self):
+        lane = InventoryManager(storage=csv_storage(self.directory))
+        lane.add_product('P1', 'Fan', 1.0, 10)
+        orders = OrderManager(lane)
+        self.assertTrue(orders.add_to_cart('P1', 3))
+
+        other_lane = InventoryManager(storage=csv_storage(self.directory))
+        with other_lane.batch():
+            other_lane.update_product('P1', price=9.0)
+
+        bill = orders.process_order()
+        self.assertIn("3 x 9.00 = 27.00", bill)
+        self.assertIn("TOTAL: 27.00", bill)
+        items, _ = csv_storage(self.directory).read_new_line_items(None)
+        _, product_id, quantity, unit_price, subtotal = items[0]
+        self.assertEqual((float(unit_price), float(subtotal)), (9.0, 27.0))
+        self.assertEqual(orders.sales_records[-1]['total'], 27.0)
+
+class CartDeletedProductTest(unittest.TestCase):
+    """A cart line whose product is deleted in another lane can still be
+    removed, and checkout says which line is no longer sold."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.lane = InventoryManager(storage=csv_storage(self.directory))
+        self.lane.add_product('P1', 'Fan', 1.0, 10)
+        self.lane.add_product('P2', 'Lamp', 2.0, 10)
+        self.orders = OrderManager(self.lane)
+        self.assertTrue(self.orders.add_to_cart('P1', 1))
+        self.assertTrue(self.orders.add_to_cart('P2', 1))
+        self.other_lane = InventoryManager(storage=csv_storage(self.directory))
+        self.other_lane.delete_product('P1')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_checkout_names_deleted_line(self):
+        self.assertFalse(self.orders.process_order())
+        self.assertEqual(self.orders.unavailable, ['P1'])
+        self.assertEqual(self.orders.order_error(), "no longer sold: P1")
+
+    def test_deleted_line_can_be_removed(self):
+        self.assertFalse(self.orders.process_order())
+        self.assertTrue(self.orders.remove_from_cart('P1'))
+        self.assertIn("Lamp (P2)", self.orders.process_order())
+
+    def test_product_added_back_is_sold(self):
+        self.other_lane.add_product('P1', 'Fan', 1.5, 4)
+        bill = self.orders.process_order()
+        self.assertIn("Fan (P1) - 1 x 1.50 = 1.50", bill)
+        self.assertEqual(self.orders.unavailable, [])
+
+if __name__ == '__main__':
+    unittest.main()
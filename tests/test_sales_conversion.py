@@ -0,0 +1,64 @@
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sales_line_items import LineItemLog, convert_sales_records, has_legacy_details
+
+class ConvertSalesRecordsTest(unittest.TestCase):
+    """Converting a legacy sales file can be rerun after a crash, and bad
+    ``details`` values are skipped."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sales_file = os.path.join(self.directory, 'sales_records.csv')
+        self.log = LineItemLog(os.path.join(self.directory, 'sales_line_items.csv'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_legacy(self, details):
+        with open(self.sales_file, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['order_id', 'datetime', 'items', 'total', 'details'])
+            for number, detail in enumerate(details):
+                writer.writerow([f"O{number}", '2025-09-30T12:00:00', 1, 2.0, detail])
+
+    def test_rerun_after_crash_does_not_duplicate(self):
+        # More than one append's worth, so the crash comes after items landed.
+        self.write_legacy(["[('Fan', 1, 2.0)]"] * 10005)
+        append = self.log.append
+        calls = []
+        def crashing_append(line_items):
+            calls.append(len(line_items))
+            if len(calls) == 2:
+                raise OSError("crash")
+            append(line_items)
+        self.log.append = crashing_append
+        with self.assertRaises(OSError):
+            convert_sales_records(self.sales_file, self.log, {'Fan': 'P1'})
+        self.assertTrue(has_legacy_details(self.sales_file))
+
+        self.log.append = append
+        counts = convert_sales_records(self.sales_file, self.log, {'Fan': 'P1'})
+        self.assertEqual(counts, {'line_items': 10005, 'skipped_orders': 0})
+        self.assertEqual(len(list(self.log.iter_items())), 10005)
+        self.assertFalse(os.path.exists(self.sales_file + '.converting'))
+
+    def test_malformed_details_are_skipped(self):
+        self.write_legacy(["[('Fan', 2, 4.0)]", "[('Fan', 2", "42", "[('Fan', 'two', 4.0)]",
+                           "[('Lamp', 1, 3.0)]"])
+        counts = convert_sales_records(self.sales_file, self.log, {'Fan': 'P1'})
+        self.assertEqual(counts, {'line_items': 2, 'skipped_orders': 3})
+        items = list(self.log.iter_items())
+        self.assertEqual([(item['order_id'], item['product_id']) for item in items],
+                         [('O0', 'P1'), ('O4', '')])
+        with open(self.sales_file, newline='') as file:
+            self.assertEqual(len(list(csv.DictReader(file))), 5)
+
+if __name__ == '__main__':
+    unittest.main()
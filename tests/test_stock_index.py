@@ -0,0 +1,100 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import csv_storage
+from inventory_backend import InventoryManager, OrderManager
+
+class StockIndexTest(unittest.TestCase):
+    """Low stock queries read the stock index, which must agree with a
+    scan of the catalog."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = InventoryManager(storage=csv_storage(self.directory))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def low_ids(self, manager, threshold):
+        return [product.product_id for product in manager.get_low_stock_products(threshold)]
+
+    def scan_ids(self, manager, threshold):
+        return [product.product_id for product in manager.products
+                if product.quantity <= threshold]
+
+    def test_threshold_is_inclusive(self):
+        self.manager.add_product('P1', 'Fan', 1.0, 5)
+        self.manager.add_product('P2', 'Lamp', 1.0, 6)
+        self.manager.add_product('P3', 'Rug', 1.0, 0)
+        self.assertEqual(self.low_ids(self.manager, 5), ['P1', 'P3'])
+        self.assertEqual(self.low_ids(self.manager, -1), [])
+
+    def test_matches_scan_after_random_changes(self):
+        generator = random.Random(11)
+        with self.manager.batch():
+            for number in range(300):
+                product_id = f"P{generator.randrange(80)}"
+                quantity = generator.randint(-3, 12)
+                if generator.random() < 0.15:
+                    self.manager.delete_product(product_id)
+                elif self.manager.get_product(product_id) is None:
+                    self.manager.add_product(product_id, 'Item', 1.0, quantity)
+                else:
+                    self.manager.update_product(product_id, quantity=quantity)
+        self.manager.compact()
+        reloaded = InventoryManager(storage=csv_storage(self.directory))
+        for manager in (self.manager, reloaded):
+            for threshold in (-4, -1, 0, 3, 5, 12, 100):
+                self.assertEqual(self.low_ids(manager, threshold),
+                                 self.scan_ids(manager, threshold), threshold)
+
+class LowStockListenerTest(unittest.TestCase):
+    """Listeners hear about products an order takes from above their
+    threshold to at or below it, once per order."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.manager = InventoryManager(storage=csv_storage(self.directory))
+        self.manager.add_product('P1', 'Fan', 1.0, 7)
+        self.manager.add_product('P2', 'Lamp', 1.0, 3)
+        self.manager.add_product('P3', 'Rug', 1.0, 20)
+        self.orders = OrderManager(self.manager)
+        self.alerts = []
+        self.orders.add_low_stock_listener(
+            lambda products: self.alerts.append(sorted(product.product_id
+                                                       for product in products)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def order(self, *lines):
+        for product_id, quantity in lines:
+            self.assertTrue(self.orders.add_to_cart(product_id, quantity))
+        self.assertTrue(self.orders.process_order())
+
+    def test_alerts_on_crossing_only(self):
+        self.order(('P1', 1))
+        self.assertEqual(self.alerts, [])
+        # P1 crosses 5; P2 was already low; P3 stays high.
+        self.order(('P1', 1), ('P1', 1), ('P2', 1), ('P3', 1))
+        self.assertEqual(self.alerts, [['P1']])
+        self.order(('P1', 1))
+        self.assertEqual(self.alerts, [['P1']])
+
+    def test_own_threshold(self):
+        thresholds = []
+        self.orders.add_low_stock_listener(
+            lambda products: thresholds.append([product.product_id for product in products]),
+            threshold=15)
+        self.order(('P3', 5), ('P1', 2))
+        self.assertEqual(thresholds, [['P3']])
+        self.assertEqual(self.alerts, [['P1']])
+
+if __name__ == '__main__':
+    unittest.main()